@@ -23,6 +23,9 @@ class AlexaResponse:
 
         self.remove_endpoint = kwargs.get('remove_endpoint', False)
 
+        # An optional function called with each payload endpoint as it is added, ex: to validate it
+        self.endpoint_validator = kwargs.get('endpoint_validator', None)
+
         self.context_properties = []
         self.payload_endpoints = []
 
@@ -73,7 +76,10 @@ class AlexaResponse:
             endpoint['cookie'][key] = value
 
     def add_payload_endpoint(self, **kwargs):
-        self.payload_endpoints.append(self.create_payload_endpoint(**kwargs))
+        endpoint = self.create_payload_endpoint(**kwargs)
+        if self.endpoint_validator is not None:
+            self.endpoint_validator(endpoint)
+        self.payload_endpoints.append(endpoint)
 
     @staticmethod
     def create_context_property(**kwargs):
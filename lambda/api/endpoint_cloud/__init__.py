@@ -1,5 +1,10 @@
 from .api_auth import ApiAuth
+from .api_cache import ApiCache
+from .api_clients import ApiClients
+from .api_connection_pool import ApiConnectionPool
+from .api_event_queue import ApiEventDispatcher
 from .api_handler import ApiHandler
 from .api_response import ApiResponse
 from .api_response_body import ApiResponseBody
+from .api_shadow_writer import ApiShadowWriter
 from .api_utils import ApiUtils
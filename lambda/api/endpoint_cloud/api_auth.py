@@ -11,20 +11,28 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
 
-import http.client
+import json
 from urllib.parse import urlencode
 
+from .api_cache import ApiCache
+from .api_connection_pool import connection_pool
+
+# Login with Amazon access tokens are valid for one hour, but a token can already be most of the way through
+# its life when it is first seen, so its profile is only cached for a small part of that
+USER_PROFILE_TTL = 300
+
+# Access token to user profile, shared across warm invocations
+user_profile_cache = ApiCache(max_size=1024, ttl=USER_PROFILE_TTL)
+
 
 class ApiAuth:
 
     def post_to_api(self, payload):
-        connection = http.client.HTTPSConnection("api.amazon.com")
         headers = {
             'content-type': "application/x-www-form-urlencoded",
             'cache-control': "no-cache"
         }
-        connection.request('POST', '/auth/o2/token', urlencode(payload), headers)
-        return connection.getresponse()
+        return connection_pool.request('api.amazon.com', 'POST', '/auth/o2/token', urlencode(payload), headers)
 
     def get_access_token(self, code, client_id, client_secret, redirect_uri):
         payload = {
@@ -38,9 +46,25 @@ class ApiAuth:
 
     @staticmethod
     def get_user_id(access_token):
-        connection = http.client.HTTPSConnection('api.amazon.com')
-        connection.request('GET', '/user/profile?access_token=' + access_token)
-        return connection.getresponse()
+        return connection_pool.request('api.amazon.com', 'GET', '/user/profile?access_token=' + access_token)
+
+    @staticmethod
+    def get_user_profile(access_token):
+        """
+        Get the user profile for an access token, profiles are cached for USER_PROFILE_TTL seconds
+        The tokens come from Alexa directives without their expiry, so the short TTL is what bounds the cache
+        :param access_token: The LWA access token
+        :return: The user profile as a dict, error responses are returned but not cached
+        """
+        profile = user_profile_cache.get(access_token)
+        if profile is not None:
+            return profile
+
+        profile = json.loads(ApiAuth.get_user_id(access_token).read().decode('utf-8'))
+        if 'error' not in profile:
+            user_profile_cache.put(access_token, profile)
+        print('LOG api_auth.get_user_profile.user_profile_cache:', user_profile_cache.stats())
+        return profile
 
     def refresh_access_token(self, refresh_token, client_id, client_secret, redirect_uri):
         payload = {
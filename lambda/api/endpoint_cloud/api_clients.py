@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in
+# compliance with the License. A copy of the License is located at
+#
+#    http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import threading
+
+
+class ApiClients:
+    """
+    The boto3 clients and resources used by the package
+    Each one is created on first use and then reused for the life of the Lambda container
+    Clients are thread safe and shared, resources are not, so each thread gets its own from its own session
+    """
+
+    _clients = {}
+    _lock = threading.Lock()
+    _local = threading.local()
+
+    class LazyClient:
+        """
+        Stands in for a boto3 client at module level, the client is created on the first attribute access
+        """
+
+        def __init__(self, service_name):
+            self.service_name = service_name
+
+        def __getattr__(self, name):
+            return getattr(ApiClients.client(self.service_name), name)
+
+    @classmethod
+    def client(cls, service_name):
+        client = cls._clients.get(service_name)
+        if client is None:
+            # Creating clients from the default boto3 session is not thread safe
+            with cls._lock:
+                client = cls._clients.get(service_name)
+                if client is None:
+                    import boto3
+                    print('LOG api_clients.client: Creating', service_name, 'client')
+                    client = boto3.client(service_name)
+                    cls._clients[service_name] = client
+        return client
+
+    @classmethod
+    def lazy_client(cls, service_name):
+        return cls.LazyClient(service_name)
+
+    @classmethod
+    def resource(cls, service_name):
+        resources = cls._thread_state('resources')
+        resource = resources.get(service_name)
+        if resource is None:
+            session = getattr(cls._local, 'session', None)
+            if session is None:
+                import boto3
+                session = cls._local.session = boto3.session.Session()
+            print('LOG api_clients.resource: Creating', service_name, 'resource for', threading.current_thread().name)
+            resource = session.resource(service_name)
+            resources[service_name] = resource
+        return resource
+
+    @classmethod
+    def table(cls, table_name):
+        tables = cls._thread_state('tables')
+        table = tables.get(table_name)
+        if table is None:
+            table = cls.resource('dynamodb').Table(table_name)
+            tables[table_name] = table
+        return table
+
+    @classmethod
+    def _thread_state(cls, name):
+        state = getattr(cls._local, name, None)
+        if state is None:
+            state = {}
+            setattr(cls._local, name, state)
+        return state
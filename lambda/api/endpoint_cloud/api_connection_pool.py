@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in
+# compliance with the License. A copy of the License is located at
+#
+#    http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import http.client
+import select
+import threading
+import time
+
+# Errors raised when a kept alive socket was closed by the server while it sat idle in the pool
+STALE_CONNECTION_ERRORS = (http.client.BadStatusLine, http.client.CannotSendRequest, ConnectionError)
+
+# Methods that can be sent again without changing the result, ex: a POST to the Event Gateway cannot
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+class ApiConnectionPool:
+    """
+    A pool of keep-alive HTTPS connections keyed by host
+    Module level instances live as long as the Lambda container, so warm invocations reuse open sockets
+    """
+
+    class Response:
+        """
+        A fully read HTTP response, the body is read before the connection is returned to the pool
+        """
+
+        def __init__(self, response):
+            self.status = response.status
+            self.reason = response.reason
+            self.headers = response.getheaders()
+            self.body = response.read()
+            self.will_close = response.will_close
+
+        def getcode(self):
+            return self.status
+
+        def getheader(self, name, default=None):
+            for key, value in self.headers:
+                if key.lower() == name.lower():
+                    return value
+            return default
+
+        def read(self):
+            return self.body
+
+    def __init__(self, max_connections=4, host_limits=None, timeout=5, max_idle_seconds=50):
+        """
+        :param max_connections: The default maximum number of concurrent connections to a host
+        :param host_limits: A dict of host to maximum number of connections, overrides max_connections
+        :param timeout: The socket timeout in seconds
+        :param max_idle_seconds: Idle connections older than this are closed rather than reused
+        """
+        self.max_connections = max_connections
+        self.host_limits = dict(host_limits or {})
+        self.timeout = timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.metrics = {
+            'requests': 0,
+            'created': 0,
+            'reused': 0,
+            'reconnected': 0,
+            'expired': 0,
+            'errors': 0
+        }
+        self._idle = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection, last_used in connections:
+                    connection.close()
+            self._idle.clear()
+
+    def get_limit(self, host):
+        return self.host_limits.get(host, self.max_connections)
+
+    def request(self, host, method, url, body=None, headers=None):
+        """
+        Send a request over a pooled connection
+        Idempotent requests are retried once on a fresh connection if the pooled socket was stale, other requests
+        may have reached the server so the error is raised rather than risk sending them twice
+        :return: ApiConnectionPool.Response
+        """
+        with self._get_slot(host):
+            connection, reused = self._acquire(host)
+            try:
+                response = self._send(connection, method, url, body, headers)
+            except STALE_CONNECTION_ERRORS:
+                connection.close()
+                if not reused or method.upper() not in IDEMPOTENT_METHODS:
+                    self._count('errors')
+                    raise
+                print('WARN api_connection_pool.request: Stale connection to', host, 'reconnecting')
+                self._count('reconnected')
+                connection = self._connect(host)
+                try:
+                    response = self._send(connection, method, url, body, headers)
+                except Exception:
+                    connection.close()
+                    self._count('errors')
+                    raise
+            except Exception:
+                connection.close()
+                self._count('errors')
+                raise
+
+            self._count('requests')
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(host, connection)
+            return response
+
+    def _acquire(self, host):
+        now = time.monotonic()
+        with self._lock:
+            connections = self._idle.get(host, [])
+            while connections:
+                connection, last_used = connections.pop()
+                if now - last_used < self.max_idle_seconds and not self._is_closed(connection):
+                    self.metrics['reused'] += 1
+                    return connection, True
+                self.metrics['expired'] += 1
+                connection.close()
+        return self._connect(host), False
+
+    def _connect(self, host):
+        self._count('created')
+        return http.client.HTTPSConnection(host, timeout=self.timeout)
+
+    def _count(self, metric):
+        with self._lock:
+            self.metrics[metric] += 1
+
+    def _get_slot(self, host):
+        with self._lock:
+            slot = self._slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.get_limit(host))
+                self._slots[host] = slot
+            return slot
+
+    @staticmethod
+    def _is_closed(connection):
+        """
+        An idle socket only becomes readable when the server closed it, catching most stale sockets before a request is written
+        """
+        if connection.sock is None:
+            return True
+        try:
+            readable, writable, failed = select.select([connection.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _release(self, host, connection):
+        with self._lock:
+            self._idle.setdefault(host, []).append((connection, time.monotonic()))
+
+    def _send(self, connection, method, url, body, headers):
+        connection.request(method, url, body, headers or {})
+        return self.Response(connection.getresponse())
+
+
+# Shared by every caller in the container
+connection_pool = ApiConnectionPool()
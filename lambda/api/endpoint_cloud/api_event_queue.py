@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in
+# compliance with the License. A copy of the License is located at
+#
+#    http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ApiEventDispatcher:
+    """
+    Sends the ChangeReports queued while handling one request before the caller returns
+    Properties queued for the same endpoint are combined into one ChangeReport, the latest value of a property wins
+    Lambda freezes the container once the handler returns, so nothing is left to send in the background
+    """
+
+    def __init__(self, send, max_attempts=3, backoff=0.1, max_workers=8):
+        """
+        :param send: A function of (user_id, endpoint_id, properties) returning the HTTP status of the sent ChangeReport
+        :param max_attempts: The number of times a ChangeReport is sent before it is given up
+        :param backoff: The delay before the first retry in seconds, doubled on every following attempt
+        :param max_workers: The number of ChangeReports sent at once
+        """
+        self.send = send
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_workers = max_workers
+        self._pending = OrderedDict()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def enqueue(self, user_id, endpoint_id, prop):
+        properties = self._pending.setdefault((user_id, endpoint_id), OrderedDict())
+        key = (prop.get('namespace'), prop.get('instance'), prop.get('name'))
+        properties.pop(key, None)
+        properties[key] = prop
+
+    def flush(self):
+        """
+        Send every queued ChangeReport, retrying the ones that fail after a backoff
+        :return: A dict of endpoint_id to 'SENT', or 'FAILED' when its ChangeReport could not be sent
+        """
+        pending, self._pending = self._pending, OrderedDict()
+        results = {}
+        for attempt in range(self.max_attempts):
+            if not pending:
+                break
+            if attempt > 0:
+                delay = self.backoff * (2 ** (attempt - 1))
+                print('WARN api_event_queue.flush: Retrying', len(pending), 'ChangeReports in', delay, 'seconds')
+                time.sleep(delay)
+
+            if len(pending) == 1:
+                sent = [self.dispatch(user_id, endpoint_id, properties) for (user_id, endpoint_id), properties in pending.items()]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                    futures = [executor.submit(self.dispatch, user_id, endpoint_id, properties) for (user_id, endpoint_id), properties in pending.items()]
+                    sent = [future.result() for future in futures]
+
+            failed = OrderedDict()
+            for ((user_id, endpoint_id), properties), is_sent in zip(pending.items(), sent):
+                if is_sent:
+                    results[endpoint_id] = 'SENT'
+                else:
+                    failed[(user_id, endpoint_id)] = properties
+            pending = failed
+
+        for user_id, endpoint_id in pending:
+            print('ERR api_event_queue.flush: Dropping ChangeReport for', endpoint_id, 'after', self.max_attempts, 'attempts')
+            results[endpoint_id] = 'FAILED'
+        return results
+
+    def dispatch(self, user_id, endpoint_id, properties):
+        """
+        Send one combined ChangeReport
+        :return: True when the Alexa Event Gateway accepted it
+        """
+        print('LOG api_event_queue.dispatch:', len(properties), 'properties for', endpoint_id)
+        try:
+            status = self.send(user_id, endpoint_id, list(properties.values()))
+        except Exception as e:
+            print('ERR api_event_queue.dispatch Exception:', e)
+            return False
+        if status is not None and 200 <= int(status) < 300:
+            return True
+        print('WARN api_event_queue.dispatch: ChangeReport for', endpoint_id, 'not accepted, status:', status)
+        return False
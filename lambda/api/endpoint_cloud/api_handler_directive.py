@@ -12,26 +12,65 @@
 # language governing permissions and limitations under the License.
 
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
-import boto3
 from botocore.exceptions import ClientError
 
 from alexa.skills.smarthome import AlexaResponse
-from jsonschema import validate, SchemaError, ValidationError
+from jsonschema import CompiledValidator, Draft4Validator, RefResolver, SchemaError, ValidationError
 from .api_auth import ApiAuth
+from .api_clients import ApiClients
 from .api_handler_endpoint import ApiHandlerEndpoint
+from .api_utils import ApiUtils
 
-dynamodb_aws = boto3.client('dynamodb')
-iot_aws = boto3.client('iot')
-iot_data_aws = boto3.client('iot-data')
+dynamodb_aws = ApiClients.lazy_client('dynamodb')
+iot_data_aws = ApiClients.lazy_client('iot-data')
+
+# Worker threads for independent lookups, threads are started on demand and reused across warm invocations
+lookup_executor = ThreadPoolExecutor(max_workers=3)
+
+# Set the validate_responses environment variable to true to check every response against the Alexa message schema
+VALIDATE_RESPONSES = os.environ.get('validate_responses', 'false').lower() == 'true'
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'alexa_smart_home_message_schema.json')
+
+# The response validator and the validator for a single Discover.Response endpoint, created once per container by get_response_validator
+response_validator = None
+endpoint_validator = None
 
 DEFAULT_VAL = {
     'Alexa.RangeController': 1,
     'Alexa.PowerController': 'OFF'
 }
 
-class ApiHandlerDirective:
+
+# Directive handlers keyed by (namespace, name), a name of None handles every directive in the namespace
+directive_handlers = {}
+
+
+def handles(namespace, *names):
+    """
+    Register the decorated DirectiveHandler class for a namespace, the handler is created once at import time
+    :param namespace The directive namespace, ex: Alexa.PowerController
+    :param names The directive names to handle, if none are given all directives in the namespace are handled
+    """
+
+    def _handles(cls):
+        handler = cls()
+        for name in names or (None,):
+            directive_handlers[(namespace, name)] = handler
+        return cls
+    return _handles
+
+
+class DirectiveHandler:
+    """
+    The base of the registered directive handlers, each defines
+    handle(self, json_object, client_id, client_secret, redirect_uri) taking the parsed directive request body
+    and returning an Alexa response dictionary, or None if the directive was not handled
+    """
 
     @staticmethod
     def get_db_value(value):
@@ -39,6 +78,20 @@ class ApiHandlerDirective:
             value = value['S']
         return value
 
+
+class ApiHandlerDirective:
+
+    @staticmethod
+    def get_db_value(value):
+        return DirectiveHandler.get_db_value(value)
+
+    @staticmethod
+    def get_handler(namespace, name):
+        handler = directive_handlers.get((namespace, name))
+        if handler is None:
+            handler = directive_handlers.get((namespace, None))
+        return handler
+
     def process(self, request, client_id, client_secret, redirect_uri):
         print('LOG api_handler_directive.process -----')
         # print(json.dumps(request))
@@ -50,333 +103,13 @@ class ApiHandlerDirective:
         if json_body:
             json_object = json.loads(json_body)
             namespace = json_object['directive']['header']['namespace']
+            name = json_object['directive']['header']['name']
 
-            if namespace == "Alexa":
-                name = json_object['directive']['header']['name']
-                correlation_token = json_object['directive']['header']['correlationToken']
-                token = json_object['directive']['endpoint']['scope']['token']
-                endpoint_id = json_object['directive']['endpoint']['endpointId']
-
-                if name == 'ReportState':
-                    # Get the User ID from the access_token
-                    response_user_id = json.loads(ApiAuth.get_user_id(token).read().decode('utf-8'))
-                    result = dynamodb_aws.get_item(TableName='SampleEndpointDetails', Key={'EndpointId': {'S': endpoint_id}})
-                    capabilities_string = self.get_db_value(result['Item']['Capabilities'])
-                    capabilities = json.loads(capabilities_string)
-                    props=[]
-                    for c in capabilities:
-                        if not 'properties' in c:
-                            continue
-                        retrievable = c['properties'].get('retrievable', False)
-                        if retrievable:
-                            props.append(c)
-                    state = {}   
-                    try: 
-                        res = iot_data_aws.get_thing_shadow(thingName=endpoint_id)
-                        shadow=json.loads(res['payload'].read())
-                        state = shadow['state']['desired']
-                    except ClientError as e:
-                        print('LOG ', e)
-                        
-                    
-                    print('Sending StateReport for', response_user_id, 'on endpoint', endpoint_id)
-                    statereport_response = AlexaResponse(name='StateReport', endpoint_id=endpoint_id, correlation_token=correlation_token, token=token)
-                    
-                    for p in props:
-                        key = p['properties']['supported'][0]['name']
-                        if 'instance' in p:
-                            key = p['instance']+'.'+key
-                        current_state = state.get(key, DEFAULT_VAL[p['interface']])
-                        if 'instance' in p:
-                            statereport_response.add_context_property(namespace=p['interface'],
-                                name=p['properties']['supported'][0]['name'], value=current_state,
-                                instance=p['instance'])
-                        else: 
-                            statereport_response.add_context_property(namespace=p['interface'],
-                                name=p['properties']['supported'][0]['name'], value=current_state)
-
-
-                    response = statereport_response.get()
-
-            if namespace == "Alexa.Authorization":
-                grant_code = json_object['directive']['payload']['grant']['code']
-                grantee_token = json_object['directive']['payload']['grantee']['token']
-
-                # Spot the default from the Alexa.Discovery sample. Use as a default for development.
-                if grantee_token == 'access-token-from-skill':
-                    user_id = "0"  # <- Useful for development
-                    response_object = {
-                        'access_token': 'INVALID',
-                        'refresh_token': 'INVALID',
-                        'token_type': 'Bearer',
-                        'expires_in': 9000
-                    }
-                else:
-                    # Get the User ID
-                    response_user_id = json.loads(ApiAuth.get_user_id(grantee_token).read().decode('utf-8'))
-                    if 'error' in response_user_id:
-                        print('ERROR api_handler_directive.process.authorization.user_id:', response_user_id['error_description'])
-                        return AlexaResponse(name='ErrorResponse', payload={'type': 'INTERNAL_ERROR', 'message': response_user_id})
-
-                    user_id = response_user_id['user_id']
-                    print('LOG api_handler_directive.process.authorization.user_id:', user_id)
-
-                # Get the Access and Refresh Tokens
-                api_auth = ApiAuth()
-                print('grant_code', grant_code, 'client_id', client_id, 'client_secret', client_secret, 'redirect_uri', redirect_uri)
-                response_token = api_auth.get_access_token(grant_code, client_id, client_secret, redirect_uri)
-                response_token_string = response_token.read().decode('utf-8')
-                print('LOG api_handler_directive.process.authorization.response_token_string:', response_token_string)
-                response_object = json.loads(response_token_string)
-
-                if 'error' in response_object:
-                    return AlexaResponse(name='ErrorResponse', payload={'type': 'INTERNAL_ERROR', 'response_object': response_object})
-
-                # Store the retrieved from the Authorization Server
-                access_token = response_object['access_token']
-                refresh_token = response_object['refresh_token']
-                token_type = response_object['token_type']
-                expires_in = response_object['expires_in']
-
-                # Calculate expiration
-                expiration_utc = datetime.utcnow() + timedelta(seconds=(int(expires_in) - 5))
-
-                # Store the User Information - This is useful for inspection during development
-                table = boto3.resource('dynamodb').Table('SampleUsers')
-                result = table.put_item(
-                    Item={
-                        'UserId': user_id,
-                        'GrantCode': grant_code,
-                        'GranteeToken': grantee_token,
-                        'AccessToken': access_token,
-                        'ClientId': client_id,
-                        'ClientSecret': client_secret,
-                        'ExpirationUTC': expiration_utc.strftime("%Y-%m-%dT%H:%M:%S.00Z"),
-                        'RedirectUri': redirect_uri,
-                        'RefreshToken': refresh_token,
-                        'TokenType': token_type
-                    }
-                )
-
-                if result['ResponseMetadata']['HTTPStatusCode'] == 200:
-                    print('LOG api_handler_directive.process.authorization.SampleUsers.put_item:', result)
-                    alexa_accept_grant_response = AlexaResponse(namespace='Alexa.Authorization', name='AcceptGrant.Response')
-                    response = alexa_accept_grant_response.get()
-                else:
-                    error_message = 'Error creating User'
-                    print('ERR api_handler_directive.process.authorization', error_message)
-                    alexa_error_response = AlexaResponse(name='ErrorResponse')
-                    alexa_error_response.set_payload({'type': 'INTERNAL_ERROR', 'message': error_message})
-                    response = alexa_error_response.get()
-
-            if namespace == "Alexa.Cooking":
-                name = json_object['directive']['header']['name']
-                correlation_token = json_object['directive']['header']['correlationToken']
-                token = json_object['directive']['endpoint']['scope']['token']
-                endpoint_id = json_object['directive']['endpoint']['endpointId']
-                if name == "SetCookingMode":
-                    alexa_error_response = AlexaResponse(endpoint_id=endpoint_id, correlation_token=correlation_token, token=token)
-                    response = alexa_error_response.get()
-
-            if namespace == "Alexa.Discovery":
-                # Given the Access Token, get the User ID
-                access_token = json_object['directive']['payload']['scope']['token']
-
-                # Spot the default from the Alexa.Discovery sample. Use as a default for development.
-                if access_token == 'access-token-from-skill':
-                    print('WARN api_handler_directive.process.discovery.user_id: Using development user_id of 0')
-                    user_id = "0"  # <- Useful for development
-                else:
-                    response_user_id = json.loads(ApiAuth.get_user_id(access_token).read().decode('utf-8'))
-                    if 'error' in response_user_id:
-                        print('ERROR api_handler_directive.process.discovery.user_id: ' + response_user_id['error_description'])
-                    user_id = response_user_id['user_id']
-                    print('LOG api_handler_directive.process.discovery.user_id:', user_id)
-
-                adr = AlexaResponse(namespace='Alexa.Discovery', name='Discover.Response')
-
-                # Get the list of endpoints to return for a User ID and add them to the response
-                # Use the AWS IoT entries for state but get the discovery details from DynamoDB
-                # Wanted to list by group name but that requires a second lookup for the details
-                # iot_aws.list_things_in_thing_group(thingGroupName="Samples")
-                list_response = iot_aws.list_things()
-
-                # Get a list of sample things by the user_id attribute
-                for thing in list_response['things']:
-                    if 'user_id' in thing['attributes']:
-                        if thing['attributes']['user_id'] == user_id:
-                            # We have an endpoint thing!
-                            endpoint_details = ApiHandlerEndpoint.EndpointDetails()
-                            endpoint_details.id = str(thing['thingName'])
-                            print('LOG api_handler_directive.process.discovery: Found:', endpoint_details.id, 'for user:', user_id)
-                            result = dynamodb_aws.get_item(TableName='SampleEndpointDetails', Key={'EndpointId': {'S': endpoint_details.id}})
-                            capabilities_string = self.get_db_value(result['Item']['Capabilities'])
-                            endpoint_details.capabilities = json.loads(capabilities_string)
-                            endpoint_details.description = self.get_db_value(result['Item']['Description'])
-                            endpoint_details.display_categories = json.loads(self.get_db_value(result['Item']['DisplayCategories']))
-                            endpoint_details.friendly_name = self.get_db_value(result['Item']['FriendlyName'])
-                            endpoint_details.manufacturer_name = self.get_db_value(result['Item']['ManufacturerName'])
-                            endpoint_details.sku = self.get_db_value(result['Item']['SKU'])
-                            endpoint_details.user_id = self.get_db_value(result['Item']['UserId'])
-
-                            adr.add_payload_endpoint(
-                                friendly_name=endpoint_details.friendly_name,
-                                endpoint_id=endpoint_details.id,
-                                capabilities=endpoint_details.capabilities,
-                                display_categories=endpoint_details.display_categories,
-                                manufacturer_name=endpoint_details.manufacturer_name
-                                )
-
-                response = adr.get()
-
-            if namespace == "Alexa.PowerController":
-                name = json_object['directive']['header']['name']
-                correlation_token = None
-                if 'correlationToken' in json_object['directive']['header']:
-                    correlation_token = json_object['directive']['header']['correlationToken']
-                token = json_object['directive']['endpoint']['scope']['token']
-                endpoint_id = json_object['directive']['endpoint']['endpointId']
-
-                response_user_id = json.loads(ApiAuth.get_user_id(token).read().decode('utf-8'))
-                if 'error' in response_user_id:
-                    print('ERROR api_handler_directive.process.power_controller.user_id: ' + response_user_id['error_description'])
-                user_id = response_user_id['user_id']
-                print('LOG api_handler_directive.process.power_controller.user_id:', user_id)
-
-                # Convert to a local stored state
-                power_state_value = 'OFF' if name == "TurnOff" else 'ON'
-                msg = {
-                    'state': {
-                        'desired':
-                            {
-                                'powerState': 'ON'
-                            }
-                    }
-                }
-
-                msg['state']['desired']['powerState'] = power_state_value
-                mqtt_msg = json.dumps(msg)
-                # Send the state to the Thing Shadow
-                try:
-                    response_update = iot_data_aws.update_thing_shadow(thingName=endpoint_id, payload=mqtt_msg.encode())
-                    print('LOG api_handler_directive.process.power_controller.response_update -----')
-                    print(response_update)
-                    alexa_response = AlexaResponse(token=token, correlation_token=correlation_token, endpoint_id=endpoint_id)
-                    alexa_response.add_context_property(namespace='Alexa.PowerController', name='powerState', value=power_state_value)
-                    alexa_response.add_context_property()
-                    response = alexa_response.get()
-
-                except ClientError as e:
-                    print('ERR api_handler_directive.process.power_controller Exception:ClientError:', e)
-                    response = AlexaResponse(name='ErrorResponse', message=e).get()
-
-            if namespace == "Alexa.ModeController":
-                alexa_error_response = AlexaResponse(name='ErrorResponse')
-                alexa_error_response.set_payload({'type': 'INTERNAL_ERROR', 'message': 'Not Yet Implemented'})
-                response = alexa_error_response.get()
-
-            if namespace == "Alexa.RangeController":
-                name = json_object['directive']['header']['name']
-                correlation_token = json_object['directive']['header']['correlationToken']
-                instance = json_object['directive']['header']['instance']
-                token = json_object['directive']['endpoint']['scope']['token']
-                endpoint_id = json_object['directive']['endpoint']['endpointId']
-                
-                result = dynamodb_aws.get_item(TableName='SampleEndpointDetails', Key={'EndpointId': {'S': endpoint_id}})
-                capabilities_string = self.get_db_value(result['Item']['Capabilities'])
-                capabilities = json.loads(capabilities_string)
-                
-                for c in capabilities:
-                    if 'instance' in c and c['instance'] == instance:
-                        MIN_VAL = c['configuration']['supportedRange']['minimumValue']
-                        MAX_VAL = c['configuration']['supportedRange']['maximumValue']
-                        PREC = c['configuration']['supportedRange']['precision']
-                        break
-                
-                alexa_response = AlexaResponse(endpoint_id=endpoint_id, correlation_token=correlation_token, token=token)
-                value = 0
-                if name == "AdjustRangeValue":
-                    range_value_delta = json_object['directive']['payload']['rangeValueDelta']
-                    range_value_delta_default = json_object['directive']['payload']['rangeValueDeltaDefault']
-                    reported_range_value = 0
-
-                    # Check to see if we need to use the delta default value (The user did not give a precision)
-                    if range_value_delta_default:
-                        range_value_delta = PREC
-
-                    # Lookup the existing value of the endpoint by endpoint_id and limit ranges as appropriate - for this sample, expecting 1-6
-                    try:
-                        response = iot_data_aws.get_thing_shadow(thingName=endpoint_id)
-                        payload = json.loads(response['payload'].read())
-                        reported_range_value = payload['state']['reported'][instance + '.rangeValue']
-                        print('LOG api_handler_directive.process.range_controller.range_value:', reported_range_value)
-                    except ClientError as e:
-                        print(e)
-                    except KeyError as errorKey:
-                        print('Could not find key:', errorKey)
-
-                    new_range_value = reported_range_value + range_value_delta
-
-                    value = max(min(new_range_value, MAX_VAL), MIN_VAL)
-
-                if name == "SetRangeValue":
-                    range_value = json_object['directive']['payload']['rangeValue']
-
-                    value = max(min(range_value, MAX_VAL), MIN_VAL)
-                    alexa_response.add_context_property(
-                        namespace='Alexa.RangeController',
-                        name='rangeValue',
-                        value=value)
-
-                # Update the Thing Shadow
-                msg = {'state': {'desired': {}}}
-                # NOTE: The instance is used to keep the stored value unique
-                msg['state']['desired'][instance + '.rangeValue'] = value
-                mqtt_msg = json.dumps(msg)
-                response_update = iot_data_aws.update_thing_shadow(thingName=endpoint_id, payload=mqtt_msg.encode())
-                print('LOG api_handler_directive.process.range_controller.response_update -----')
-                print(response_update)
-
-                # Send back the response
-                response = alexa_response.get()
-
-            if namespace == "Alexa.ToggleController":
-                name = json_object['directive']['header']['name']
-                correlation_token = json_object['directive']['header']['correlationToken']
-                instance = json_object['directive']['header']['instance']
-                token = json_object['directive']['endpoint']['scope']['token']
-                endpoint_id = json_object['directive']['endpoint']['endpointId']
-
-                # Convert to a local stored state
-                toggle_state_value = 'OFF' if name == "TurnOff" else 'ON'
-                state_name = instance + '.state'
-                msg = {
-                    'state': {
-                        'desired':
-                            {
-                                state_name: 'ON'
-                            }
-                    }
-                }
-                msg['state']['desired'][state_name] = toggle_state_value
-                mqtt_msg = json.dumps(msg)
-                # Send the state to the Thing Shadow
-                try:
-                    response_update = iot_data_aws.update_thing_shadow(thingName=endpoint_id, payload=mqtt_msg.encode())
-                    print('LOG api_handler_directive.process.toggle_controller.response_update -----')
-                    print(response_update)
-                    alexa_response = AlexaResponse(token=token, correlation_token=correlation_token, endpoint_id=endpoint_id)
-                    alexa_response.add_context_property(
-                        namespace='Alexa.ToggleController',
-                        name='toggleState',
-                        instance=instance,
-                        value=toggle_state_value)
-                    alexa_response.add_context_property()
-                    response = alexa_response.get()
-
-                except ClientError as e:
-                    print('ERR api_handler_directive.process.toggle_controller Exception:ClientError:', e)
-                    response = AlexaResponse(name='ErrorResponse', message=e).get()
+            handler = self.get_handler(namespace, name)
+            if handler is not None:
+                response = handler.handle(json_object, client_id, client_secret, redirect_uri)
+            else:
+                print('WARN api_handler_directive.process: No handler for', namespace, name)
 
         else:
             alexa_error_response = AlexaResponse(name='ErrorResponse')
@@ -389,17 +122,444 @@ class ApiHandlerDirective:
             alexa_error_response.set_payload({'type': 'INTERNAL_ERROR', 'message': 'Empty Response: No response processed. Unhandled Directive.'})
             response = alexa_error_response.get()
 
+        if VALIDATE_RESPONSES:
+            validate_response(response)
+
         print('LOG api_handler_directive.process.response -----')
         print(json.dumps(response))
         return response
 
 
+@handles('Alexa', 'ReportState')
+class AlexaHandler(DirectiveHandler):
+
+    def handle(self, json_object, client_id, client_secret, redirect_uri):
+        correlation_token = json_object['directive']['header']['correlationToken']
+        token = json_object['directive']['endpoint']['scope']['token']
+        endpoint_id = json_object['directive']['endpoint']['endpointId']
+
+        # Get the User ID from the access_token, the endpoint capabilities and the endpoint state concurrently
+        user_profile_future = lookup_executor.submit(ApiAuth.get_user_profile, token)
+        capability_index_future = lookup_executor.submit(ApiHandlerEndpoint.get_capabilities, endpoint_id)
+        state_future = lookup_executor.submit(self.get_desired_state, endpoint_id)
+        response_user_id = user_profile_future.result()
+        capability_index = capability_index_future.result()
+        state = state_future.result()
+
+        print('Sending StateReport for', response_user_id, 'on endpoint', endpoint_id)
+        statereport_response = AlexaResponse(name='StateReport', endpoint_id=endpoint_id, correlation_token=correlation_token, token=token)
+
+        for interface, name, instance, shadow_key in capability_index.retrievable:
+            current_state = state.get(shadow_key, DEFAULT_VAL[interface])
+            if instance:
+                statereport_response.add_context_property(namespace=interface, name=name, value=current_state, instance=instance)
+            else:
+                statereport_response.add_context_property(namespace=interface, name=name, value=current_state)
+
+        return statereport_response.get()
+
+    @staticmethod
+    def get_desired_state(endpoint_id):
+        state = {}
+        try:
+            res = iot_data_aws.get_thing_shadow(thingName=endpoint_id)
+            shadow = json.loads(res['payload'].read())
+            state = shadow['state']['desired']
+        except ClientError as e:
+            print('LOG ', e)
+        return state
+
+
+@handles('Alexa.Authorization', 'AcceptGrant')
+class AuthorizationHandler(DirectiveHandler):
+
+    def handle(self, json_object, client_id, client_secret, redirect_uri):
+        grant_code = json_object['directive']['payload']['grant']['code']
+        grantee_token = json_object['directive']['payload']['grantee']['token']
+
+        # Spot the default from the Alexa.Discovery sample. Use as a default for development.
+        if grantee_token == 'access-token-from-skill':
+            user_id = "0"  # <- Useful for development
+            response_object = {
+                'access_token': 'INVALID',
+                'refresh_token': 'INVALID',
+                'token_type': 'Bearer',
+                'expires_in': 9000
+            }
+        else:
+            # Get the User ID
+            response_user_id = ApiAuth.get_user_profile(grantee_token)
+            if 'error' in response_user_id:
+                print('ERROR api_handler_directive.process.authorization.user_id:', response_user_id['error_description'])
+                return AlexaResponse(name='ErrorResponse', payload={'type': 'INTERNAL_ERROR', 'message': response_user_id})
+
+            user_id = response_user_id['user_id']
+            print('LOG api_handler_directive.process.authorization.user_id:', user_id)
+
+        # Get the Access and Refresh Tokens
+        api_auth = ApiAuth()
+        print('grant_code', grant_code, 'client_id', client_id, 'client_secret', client_secret, 'redirect_uri', redirect_uri)
+        response_token = api_auth.get_access_token(grant_code, client_id, client_secret, redirect_uri)
+        response_token_string = response_token.read().decode('utf-8')
+        print('LOG api_handler_directive.process.authorization.response_token_string:', response_token_string)
+        response_object = json.loads(response_token_string)
+
+        if 'error' in response_object:
+            return AlexaResponse(name='ErrorResponse', payload={'type': 'INTERNAL_ERROR', 'response_object': response_object})
+
+        # Store the retrieved from the Authorization Server
+        access_token = response_object['access_token']
+        refresh_token = response_object['refresh_token']
+        token_type = response_object['token_type']
+        expires_in = response_object['expires_in']
+
+        # Calculate expiration
+        expiration_utc = datetime.utcnow() + timedelta(seconds=(int(expires_in) - 5))
+
+        # Store the User Information - This is useful for inspection during development
+        table = ApiClients.table('SampleUsers')
+        result = table.put_item(
+            Item={
+                'UserId': user_id,
+                'GrantCode': grant_code,
+                'GranteeToken': grantee_token,
+                'AccessToken': access_token,
+                'ClientId': client_id,
+                'ClientSecret': client_secret,
+                'ExpirationUTC': expiration_utc.strftime("%Y-%m-%dT%H:%M:%S.00Z"),
+                'RedirectUri': redirect_uri,
+                'RefreshToken': refresh_token,
+                'TokenType': token_type
+            }
+        )
+
+        if result['ResponseMetadata']['HTTPStatusCode'] == 200:
+            print('LOG api_handler_directive.process.authorization.SampleUsers.put_item:', result)
+            alexa_accept_grant_response = AlexaResponse(namespace='Alexa.Authorization', name='AcceptGrant.Response')
+            return alexa_accept_grant_response.get()
+        else:
+            error_message = 'Error creating User'
+            print('ERR api_handler_directive.process.authorization', error_message)
+            alexa_error_response = AlexaResponse(name='ErrorResponse')
+            alexa_error_response.set_payload({'type': 'INTERNAL_ERROR', 'message': error_message})
+            return alexa_error_response.get()
+
+
+@handles('Alexa.Cooking', 'SetCookingMode')
+class CookingHandler(DirectiveHandler):
+
+    def handle(self, json_object, client_id, client_secret, redirect_uri):
+        correlation_token = json_object['directive']['header']['correlationToken']
+        token = json_object['directive']['endpoint']['scope']['token']
+        endpoint_id = json_object['directive']['endpoint']['endpointId']
+        alexa_response = AlexaResponse(endpoint_id=endpoint_id, correlation_token=correlation_token, token=token)
+        return alexa_response.get()
+
+
+@handles('Alexa.Discovery', 'Discover')
+class DiscoveryHandler(DirectiveHandler):
+
+    def handle(self, json_object, client_id, client_secret, redirect_uri):
+        # Given the Access Token, get the User ID
+        access_token = json_object['directive']['payload']['scope']['token']
+
+        # Spot the default from the Alexa.Discovery sample. Use as a default for development.
+        if access_token == 'access-token-from-skill':
+            print('WARN api_handler_directive.process.discovery.user_id: Using development user_id of 0')
+            user_id = "0"  # <- Useful for development
+        else:
+            response_user_id = ApiAuth.get_user_profile(access_token)
+            if 'error' in response_user_id:
+                print('ERROR api_handler_directive.process.discovery.user_id: ' + response_user_id['error_description'])
+            user_id = response_user_id['user_id']
+            print('LOG api_handler_directive.process.discovery.user_id:', user_id)
+
+        # When validating, each endpoint is checked as it is added and the final check of the response skips it
+        adr = AlexaResponse(namespace='Alexa.Discovery', name='Discover.Response', endpoint_validator=validate_endpoint if VALIDATE_RESPONSES else None)
+
+        # Get the list of endpoints to return for a User ID and add them to the response
+        # Use the AWS IoT entries for state but get the discovery details from DynamoDB
+        # Wanted to list by group name but that requires a second lookup for the details
+        # iot_aws.list_things_in_thing_group(thingGroupName="Samples")
+
+        # Get a list of sample things by the user_id attribute, only the things of this user are returned
+        endpoint_ids = []
+        for thing in ApiHandlerEndpoint.list_things(user_id):
+            print('LOG api_handler_directive.process.discovery: Found:', thing['thingName'], 'for user:', user_id)
+            endpoint_ids.append(str(thing['thingName']))
+
+        # Fetch the details for all the endpoints in batches rather than one request per endpoint
+        keys = [{'EndpointId': {'S': endpoint_id}} for endpoint_id in endpoint_ids]
+        items, unprocessed_keys = ApiUtils.batch_get_items(dynamodb_aws, 'SampleEndpointDetails', keys)
+        # Read the details the batches could not get one at a time, rather than leaving out endpoints that exist
+        for key in unprocessed_keys:
+            try:
+                result = dynamodb_aws.get_item(TableName='SampleEndpointDetails', Key=key)
+            except ClientError as e:
+                print('ERR api_handler_directive.process.discovery: Could not read the details for', key['EndpointId']['S'], e)
+                continue
+            if 'Item' in result:
+                items.append(result['Item'])
+        items_by_id = dict((self.get_db_value(item['EndpointId']), item) for item in items)
+
+        for endpoint_id in endpoint_ids:
+            item = items_by_id.get(endpoint_id)
+            if item is None:
+                print('WARN api_handler_directive.process.discovery: No details for', endpoint_id)
+                continue
+
+            endpoint_details = ApiHandlerEndpoint.EndpointDetails()
+            endpoint_details.id = endpoint_id
+            endpoint_details.capabilities = json.loads(self.get_db_value(item['Capabilities']))
+            ApiHandlerEndpoint.cache_capabilities(endpoint_id, endpoint_details.capabilities)
+            endpoint_details.description = self.get_db_value(item['Description'])
+            endpoint_details.display_categories = json.loads(self.get_db_value(item['DisplayCategories']))
+            endpoint_details.friendly_name = self.get_db_value(item['FriendlyName'])
+            endpoint_details.manufacturer_name = self.get_db_value(item['ManufacturerName'])
+            endpoint_details.sku = self.get_db_value(item['SKU'])
+            endpoint_details.user_id = self.get_db_value(item['UserId'])
+
+            adr.add_payload_endpoint(
+                friendly_name=endpoint_details.friendly_name,
+                endpoint_id=endpoint_details.id,
+                capabilities=endpoint_details.capabilities,
+                display_categories=endpoint_details.display_categories,
+                manufacturer_name=endpoint_details.manufacturer_name
+                )
+
+        return adr.get()
+
+
+@handles('Alexa.ModeController')
+class ModeControllerHandler(DirectiveHandler):
+
+    def handle(self, json_object, client_id, client_secret, redirect_uri):
+        alexa_error_response = AlexaResponse(name='ErrorResponse')
+        alexa_error_response.set_payload({'type': 'INTERNAL_ERROR', 'message': 'Not Yet Implemented'})
+        return alexa_error_response.get()
+
+
+@handles('Alexa.PowerController', 'TurnOn', 'TurnOff')
+class PowerControllerHandler(DirectiveHandler):
+
+    def handle(self, json_object, client_id, client_secret, redirect_uri):
+        name = json_object['directive']['header']['name']
+        correlation_token = None
+        if 'correlationToken' in json_object['directive']['header']:
+            correlation_token = json_object['directive']['header']['correlationToken']
+        token = json_object['directive']['endpoint']['scope']['token']
+        endpoint_id = json_object['directive']['endpoint']['endpointId']
+
+        response_user_id = ApiAuth.get_user_profile(token)
+        if 'error' in response_user_id:
+            print('ERROR api_handler_directive.process.power_controller.user_id: ' + response_user_id['error_description'])
+        user_id = response_user_id['user_id']
+        print('LOG api_handler_directive.process.power_controller.user_id:', user_id)
+
+        # Convert to a local stored state
+        power_state_value = 'OFF' if name == "TurnOff" else 'ON'
+        msg = {
+            'state': {
+                'desired':
+                    {
+                        'powerState': 'ON'
+                    }
+            }
+        }
+
+        msg['state']['desired']['powerState'] = power_state_value
+        mqtt_msg = json.dumps(msg)
+        # Send the state to the Thing Shadow
+        try:
+            response_update = iot_data_aws.update_thing_shadow(thingName=endpoint_id, payload=mqtt_msg.encode())
+            print('LOG api_handler_directive.process.power_controller.response_update -----')
+            print(response_update)
+            alexa_response = AlexaResponse(token=token, correlation_token=correlation_token, endpoint_id=endpoint_id)
+            alexa_response.add_context_property(namespace='Alexa.PowerController', name='powerState', value=power_state_value)
+            alexa_response.add_context_property()
+            return alexa_response.get()
+
+        except ClientError as e:
+            print('ERR api_handler_directive.process.power_controller Exception:ClientError:', e)
+            return AlexaResponse(name='ErrorResponse', message=e).get()
+
+
+@handles('Alexa.RangeController', 'AdjustRangeValue', 'SetRangeValue')
+class RangeControllerHandler(DirectiveHandler):
+
+    def handle(self, json_object, client_id, client_secret, redirect_uri):
+        name = json_object['directive']['header']['name']
+        correlation_token = json_object['directive']['header']['correlationToken']
+        instance = json_object['directive']['header']['instance']
+        token = json_object['directive']['endpoint']['scope']['token']
+        endpoint_id = json_object['directive']['endpoint']['endpointId']
+
+        supported_range = ApiHandlerEndpoint.get_capabilities(endpoint_id).ranges.get(instance)
+        if supported_range is None:
+            print('ERR api_handler_directive.process.range_controller: No supportedRange for instance', instance)
+            alexa_error_response = AlexaResponse(name='ErrorResponse')
+            alexa_error_response.set_payload({'type': 'INTERNAL_ERROR', 'message': 'Unknown instance: ' + instance})
+            return alexa_error_response.get()
+
+        MIN_VAL = supported_range['minimumValue']
+        MAX_VAL = supported_range['maximumValue']
+        PREC = supported_range['precision']
+
+        alexa_response = AlexaResponse(endpoint_id=endpoint_id, correlation_token=correlation_token, token=token)
+        value = 0
+        if name == "AdjustRangeValue":
+            range_value_delta = json_object['directive']['payload']['rangeValueDelta']
+            range_value_delta_default = json_object['directive']['payload']['rangeValueDeltaDefault']
+            reported_range_value = 0
+
+            # Check to see if we need to use the delta default value (The user did not give a precision)
+            if range_value_delta_default:
+                range_value_delta = PREC
+
+            # Lookup the existing value of the endpoint by endpoint_id and limit ranges as appropriate - for this sample, expecting 1-6
+            try:
+                response = iot_data_aws.get_thing_shadow(thingName=endpoint_id)
+                payload = json.loads(response['payload'].read())
+                reported_range_value = payload['state']['reported'][instance + '.rangeValue']
+                print('LOG api_handler_directive.process.range_controller.range_value:', reported_range_value)
+            except ClientError as e:
+                print(e)
+            except KeyError as errorKey:
+                print('Could not find key:', errorKey)
+
+            new_range_value = reported_range_value + range_value_delta
+
+            value = max(min(new_range_value, MAX_VAL), MIN_VAL)
+
+        if name == "SetRangeValue":
+            range_value = json_object['directive']['payload']['rangeValue']
+
+            value = max(min(range_value, MAX_VAL), MIN_VAL)
+            alexa_response.add_context_property(
+                namespace='Alexa.RangeController',
+                name='rangeValue',
+                value=value)
+
+        # Update the Thing Shadow
+        msg = {'state': {'desired': {}}}
+        # NOTE: The instance is used to keep the stored value unique
+        msg['state']['desired'][instance + '.rangeValue'] = value
+        mqtt_msg = json.dumps(msg)
+        response_update = iot_data_aws.update_thing_shadow(thingName=endpoint_id, payload=mqtt_msg.encode())
+        print('LOG api_handler_directive.process.range_controller.response_update -----')
+        print(response_update)
+
+        # Send back the response
+        return alexa_response.get()
+
+
+@handles('Alexa.ToggleController', 'TurnOn', 'TurnOff')
+class ToggleControllerHandler(DirectiveHandler):
+
+    def handle(self, json_object, client_id, client_secret, redirect_uri):
+        name = json_object['directive']['header']['name']
+        correlation_token = json_object['directive']['header']['correlationToken']
+        instance = json_object['directive']['header']['instance']
+        token = json_object['directive']['endpoint']['scope']['token']
+        endpoint_id = json_object['directive']['endpoint']['endpointId']
+
+        # Convert to a local stored state
+        toggle_state_value = 'OFF' if name == "TurnOff" else 'ON'
+        state_name = instance + '.state'
+        msg = {
+            'state': {
+                'desired':
+                    {
+                        state_name: 'ON'
+                    }
+            }
+        }
+        msg['state']['desired'][state_name] = toggle_state_value
+        mqtt_msg = json.dumps(msg)
+        # Send the state to the Thing Shadow
+        try:
+            response_update = iot_data_aws.update_thing_shadow(thingName=endpoint_id, payload=mqtt_msg.encode())
+            print('LOG api_handler_directive.process.toggle_controller.response_update -----')
+            print(response_update)
+            alexa_response = AlexaResponse(token=token, correlation_token=correlation_token, endpoint_id=endpoint_id)
+            alexa_response.add_context_property(
+                namespace='Alexa.ToggleController',
+                name='toggleState',
+                instance=instance,
+                value=toggle_state_value)
+            alexa_response.add_context_property()
+            return alexa_response.get()
+
+        except ClientError as e:
+            print('ERR api_handler_directive.process.toggle_controller Exception:ClientError:', e)
+            return AlexaResponse(name='ErrorResponse', message=e).get()
+
+
+def get_response_validator():
+    """
+    Load and check the Alexa message schema once, then reuse one compiled validator with its references already resolved
+    :return: CompiledValidator
+    """
+    global response_validator, endpoint_validator
+    if response_validator is None:
+        with open(SCHEMA_PATH, 'r') as schema_file:
+            json_schema = json.load(schema_file)
+        Draft4Validator.check_schema(json_schema)
+
+        resolver = RefResolver.from_schema(json_schema)
+        for ref in find_refs(json_schema):
+            resolver.resolve(ref)
+        # The header name and error type pick the branch of the schema's oneOf lists a response can match
+        discriminators = [('event', 'header', 'name'), ('payload', 'type')]
+        validator = Draft4Validator(json_schema, resolver=resolver, discriminators=discriminators)
+
+        for branch in json_schema['oneOf']:
+            if branch.get('description') == 'A Discover.Response message':
+                endpoint_schema = branch['properties']['event']['properties']['payload']['properties']['endpoints']['items']
+                endpoint_validator = CompiledValidator(Draft4Validator(endpoint_schema, resolver=resolver))
+        response_validator = CompiledValidator(validator)
+    return response_validator
+
+
+def find_refs(schema):
+    refs = set()
+    nodes = [schema]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, dict):
+            ref = node.get('$ref')
+            if isinstance(ref, str):
+                refs.add(ref)
+            nodes.extend(node.values())
+        elif isinstance(node, list):
+            nodes.extend(node)
+    return refs
+
+
+def validate_endpoint(endpoint):
+    """
+    Check a Discover.Response endpoint as it is added, a valid endpoint is skipped by the following validate_response
+    :param endpoint: The endpoint dict, it must not be changed after it is checked
+    :return: True if the endpoint is valid
+    """
+    validator = get_response_validator()
+    if endpoint_validator is None:
+        return False
+
+    if endpoint_validator.is_valid(endpoint):
+        validator.validator.mark_valid(endpoint, endpoint_validator.schema)
+        return True
+
+    for error in endpoint_validator.iter_errors(endpoint):
+        print('LOG api_handler_directive.validate_endpoint: Invalid Content', endpoint.get('endpointId'), error.message)
+    return False
+
+
 def validate_response(response):
     valid = False
+    validator = get_response_validator()
     try:
-        with open('alexa_smart_home_message_schema.json', 'r') as schema_file:
-            json_schema = json.load(schema_file)
-            validate(response, json_schema)
+        validator.validate(response)
         valid = True
     except SchemaError as se:
         print('LOG api_handler_directive.validate_response: Invalid Schema')
@@ -407,5 +567,8 @@ def validate_response(response):
     except ValidationError as ve:
         print('LOG api_handler_directive.validate_response: Invalid Content')
         print(ve.context)
+    finally:
+        # The endpoints checked by validate_endpoint only count for this response
+        validator.validator.clear_marks()
 
     return valid
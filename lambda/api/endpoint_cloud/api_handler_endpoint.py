@@ -12,18 +12,35 @@
 # language governing permissions and limitations under the License.
 
 import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-import boto3
 from botocore.exceptions import ClientError
 
 from endpoint_cloud.api_handler_event import ApiHandlerEvent
+from .api_cache import ApiCache
+from .api_clients import ApiClients
 from .api_utils import ApiUtils
 
-dynamodb_aws = boto3.client('dynamodb')
-iot_aws = boto3.client('iot')
+dynamodb_aws = ApiClients.lazy_client('dynamodb')
+iot_aws = ApiClients.lazy_client('iot')
 
 samples_thing_group_name = 'Samples'
 
+# Parsed endpoint capabilities by endpoint id, shared across warm invocations
+# Other containers are not told about changes so entries also expire
+capability_cache = ApiCache(max_size=512, ttl=300)
+
+# The names of the thing groups and thing types known to exist in AWS IoT, shared across warm invocations
+# Creating them is idempotent but throttled, so each is checked or created at most once per container
+known_thing_groups = set()
+known_thing_types = set()
+thing_types_listed = False
+
+# Worker threads for the AWS IoT calls of bulk requests, sized to stay under the AWS IoT API rate limits
+provisioning_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('provisioning_workers', '8')))
+
 
 class ApiHandlerEndpoint:
     class EndpointDetails:
@@ -48,52 +65,71 @@ class ApiHandlerEndpoint:
             print('sku:', self.sku)
             print('user_id:', self.user_id)
 
+    class CapabilityIndex:
+        def __init__(self, capabilities):
+            self.capabilities = capabilities
+            # Instance to its supportedRange configuration, ex: {'SampleManufacturer.Fan.Speed': {'minimumValue': 1, ...}}
+            self.ranges = {}
+            # The retrievable properties as (interface, name, instance, shadow key) tuples
+            self.retrievable = []
+
+            for capability in capabilities:
+                instance = capability.get('instance', None)
+                configuration = capability.get('configuration', {})
+                if instance and 'supportedRange' in configuration and instance not in self.ranges:
+                    self.ranges[instance] = configuration['supportedRange']
+
+                properties = capability.get('properties', {})
+                if properties.get('retrievable', False):
+                    name = properties['supported'][0]['name']
+                    shadow_key = instance + '.' + name if instance else name
+                    self.retrievable.append((capability['interface'], name, instance, shadow_key))
+
     @staticmethod
     def add_thing_to_thing_group(thing_name):
-        response = iot_aws.add_thing_to_thing_group(thingGroupName=samples_thing_group_name, thingName=thing_name)
+        try:
+            response = iot_aws.add_thing_to_thing_group(thingGroupName=samples_thing_group_name, thingName=thing_name)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                # The group was deleted outside of this container, check for it again next time
+                known_thing_groups.discard(samples_thing_group_name)
+            raise
         print('LOG api_handler_endpoint.add_thing_to_thing_group -----')
         print(json.dumps(response))
         return response
 
     @staticmethod
     def check_thing_group_name_exists():
+        if samples_thing_group_name in known_thing_groups:
+            return True
         thing_groups = iot_aws.list_thing_groups(namePrefixFilter=samples_thing_group_name, recursive=False)
         if 'thingGroups' in thing_groups:
             for thing_group in thing_groups['thingGroups']:
                 if thing_group['groupName'] == samples_thing_group_name:
                     print('checkForThingGroup found', samples_thing_group_name)
+                    known_thing_groups.add(samples_thing_group_name)
                     return True
         return False
 
+    @staticmethod
+    def cache_capabilities(endpoint_id, capabilities):
+        capability_index = ApiHandlerEndpoint.CapabilityIndex(capabilities)
+        capability_cache.put(endpoint_id, capability_index)
+        return capability_index
+
     def create(self, request):
         try:
-            endpoint_details = self.EndpointDetails()
-
             # Map our incoming API body to a thing that will virtually represent a discoverable device for Alexa
             json_object = json.loads(request['body'])
-            endpoint = json_object['event']['endpoint']
-            endpoint_details.user_id = endpoint['userId']  # Expect a Profile
-            endpoint_details.capabilities = endpoint['capabilities']
-            endpoint_details.sku = endpoint['sku']  # A custom endpoint type, ex: SW01
-
-            if 'friendlyName' in endpoint:
-                endpoint_details.friendly_name = endpoint['friendlyName']
-
-            if 'manufacturerName' in endpoint:
-                endpoint_details.manufacturer_name = endpoint['manufacturerName']
 
-            if 'description' in endpoint:
-                endpoint_details.description = endpoint['description']
+            # Many endpoints can be created at once by sending an endpoints list instead of an endpoint
+            if 'endpoints' in json_object['event']:
+                return self.create_endpoints(json_object['event']['endpoints'])
 
-            if 'displayCategories' in endpoint:
-                endpoint_details.display_categories = endpoint['displayCategories']
+            endpoint_details = self.get_endpoint_details(json_object['event']['endpoint'])
 
             # Validate the Samples group is available, if not, create it
-            thing_group_name_exists = self.check_thing_group_name_exists()
-            if not thing_group_name_exists:
-                response = self.create_thing_group(samples_thing_group_name)
-                if not ApiUtils.check_response(response):
-                    print('ERR api_handler_endpoint.create.create_thing_group.response', response)
+            self.ensure_thing_group()
 
             # Create the thing in AWS IoT
             response = self.create_thing(endpoint_details)
@@ -104,6 +140,7 @@ class ApiHandlerEndpoint:
             response = self.create_thing_details(endpoint_details)
             if not ApiUtils.check_response(response):
                 print('ERR api_handler_endpoint.create.create_thing_details.response', response)
+            capability_cache.invalidate(endpoint_details.id)
 
             # Add the thing to the Samples Thing Group
             response = self.add_thing_to_thing_group(endpoint_details.id)
@@ -129,10 +166,93 @@ class ApiHandlerEndpoint:
         except KeyError as key_error:
             return "KeyError: " + str(key_error)
 
-    def create_thing(self, endpoint_details):
+    def create_endpoints(self, endpoints):
+        """
+        Create many endpoints with one request
+        The thing group and each thing type are created once, the things are created on a bounded pool of threads,
+        the details of the created things are written with BatchWriteItem and one AddOrUpdateReport is sent per user
+        :param endpoints: A list of endpoints in the same format as a single create
+        :return: A dict with the result of each endpoint and the HTTP status code, or error, of the event for each user
+        """
+        print('LOG api_handler_endpoint.create_endpoints -----', len(endpoints), 'endpoints')
+        endpoint_details_list = [self.get_endpoint_details(endpoint) for endpoint in endpoints]
+        results = dict((endpoint_details.id, 'OK') for endpoint_details in endpoint_details_list)
+
+        self.ensure_thing_group()
+        thing_type_names = set()
+        for endpoint_details in endpoint_details_list:
+            thing_type_name = self.get_thing_type(endpoint_details.sku)[0]
+            if thing_type_name not in thing_type_names:
+                self.create_thing_type(endpoint_details.sku)
+                thing_type_names.add(thing_type_name)
+
+        # Create the things in AWS IoT and add them to the Samples Thing Group
+        def provision(endpoint_details):
+            thing_type_name = self.get_thing_type(endpoint_details.sku)[0]
+            try:
+                # An existing thing is updated instead, and that update can fail too
+                response = self.create_thing(endpoint_details, thing_type_name)
+            except ClientError as e:
+                print('ERR api_handler_endpoint.create_endpoints.create_thing', e)
+                response = None
+            if not ApiUtils.check_response(response):
+                return 'ERR Could not create the thing'
+            try:
+                self.add_thing_to_thing_group(endpoint_details.id)
+            except ClientError as e:
+                print('ERR api_handler_endpoint.create_endpoints.add_thing_to_thing_group', e)
+                return 'ERR Could not add the thing to the ' + samples_thing_group_name + ' group'
+            return 'OK'
+
+        for endpoint_details, result in zip(endpoint_details_list, provisioning_executor.map(provision, endpoint_details_list)):
+            if result != 'OK':
+                results[endpoint_details.id] = result
+
+        # Create the thing details in DynamoDb, only for the things that now exist so no details are left orphaned
+        write_requests = [
+            {'PutRequest': {'Item': self.get_thing_details_item(endpoint_details)}}
+            for endpoint_details in endpoint_details_list if results[endpoint_details.id] == 'OK'
+        ]
+        for write_request in ApiUtils.batch_write_items(dynamodb_aws, 'SampleEndpointDetails', write_requests):
+            results[write_request['PutRequest']['Item']['EndpointId']['S']] = 'ERR Could not store the endpoint details'
+        for endpoint_details in endpoint_details_list:
+            capability_cache.invalidate(endpoint_details.id)
+
+        # Send one Event per user that updates Alexa with all of their new endpoints
+        endpoints_by_user = {}
+        for endpoint_details in endpoint_details_list:
+            if results[endpoint_details.id] == 'OK':
+                endpoints_by_user.setdefault(endpoint_details.user_id, []).append({
+                    'id': endpoint_details.id,
+                    'friendlyName': endpoint_details.friendly_name,
+                    'sku': endpoint_details.sku,
+                    'capabilities': endpoint_details.capabilities
+                })
+
+        reports = {}
+        api_handler_event = ApiHandlerEvent()
+        for user_id, user_endpoints in endpoints_by_user.items():
+            # The endpoints are created, so a failed report is recorded for the user instead of failing the request
+            try:
+                token = api_handler_event.get_user_info(user_id)
+                if token is None:
+                    print('WARN api_handler_endpoint.create_endpoints: No access token, AddOrUpdateReport not sent for user', user_id)
+                    continue
+                response = api_handler_event.send_add_or_update_report(user_endpoints[0]['id'], token, user_endpoints)
+            except (ClientError, KeyError) as e:
+                print('ERR api_handler_endpoint.create_endpoints.AddOrUpdateReport: Not sent for user', user_id, e)
+                reports[user_id] = 'ERR Could not send the AddOrUpdateReport'
+                continue
+            print('LOG api_handler_endpoint.create_endpoints.AddOrUpdateReport:', response.read().decode('utf-8'))
+            reports[user_id] = response.getcode()
+
+        return {'endpoints': results, 'reports': reports}
+
+    def create_thing(self, endpoint_details, thing_type_name=None):
         print('LOG api_handler_endpoint.create_thing -----')
         # Create the ThingType if missing
-        thing_type_name = self.create_thing_type(endpoint_details.sku)
+        if thing_type_name is None:
+            thing_type_name = self.create_thing_type(endpoint_details.sku)
         try:
             response = iot_aws.create_thing(
                 thingName=endpoint_details.id,
@@ -150,7 +270,11 @@ class ApiHandlerEndpoint:
         except ClientError as e:
             if e.response['Error']['Code'] == 'ResourceAlreadyExistsException':
                 print('WARN iot resource already exists, trying update')
-                return self.update_thing(endpoint_details)
+                return self.update_thing(endpoint_details, thing_type_name)
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                # The thing type was deleted outside of this container, create it again next time
+                print('WARN iot thing type not found:', thing_type_name)
+                known_thing_types.discard(thing_type_name)
         except Exception as e:
             print(e)
             return None
@@ -159,8 +283,7 @@ class ApiHandlerEndpoint:
     def create_thing_details(endpoint_details):
         print('LOG api_handler_endpoint.create_thing_details -----')
         print('LOG api_handler_endpoint.create_thing_details.endpoint_details', endpoint_details.dump())
-        dynamodb_aws_resource = boto3.resource('dynamodb')
-        table = dynamodb_aws_resource.Table('SampleEndpointDetails')
+        table = ApiClients.table('SampleEndpointDetails')
         print('LOG api_handler_endpoint.create_thing_details Updating Item in SampleEndpointDetails')
         try:
             response = table.update_item(
@@ -200,30 +323,24 @@ class ApiHandlerEndpoint:
             thingGroupName=thing_group_name
         )
         print(json.dumps(response))
+        if ApiUtils.check_response(response):
+            known_thing_groups.add(thing_group_name)
         return response
 
     @staticmethod
     def create_thing_type(sku):
         print('LOG api_handler_endpoint.create_thing_type -----')
-        # Set the default at OTHER (OT00)
-        thing_type_name = 'SampleOther'
-        thing_type_description = 'A sample endpoint'
-
-        if sku.upper().startswith('LI'):
-            thing_type_name = 'SampleLight'
-            thing_type_description = 'A sample light endpoint'
-
-        if sku.upper().startswith('MW'):
-            thing_type_name = 'SampleMicrowave'
-            thing_type_description = 'A sample microwave endpoint'
-
-        if sku.upper().startswith('SW'):
-            thing_type_name = 'SampleSwitch'
-            thing_type_description = 'A sample switch endpoint'
-
-        if sku.upper().startswith('TT'):
-            thing_type_name = 'SampleToaster'
-            thing_type_description = 'A sample toaster endpoint'
+        thing_type_name, thing_type_description = ApiHandlerEndpoint.get_thing_type(sku)
+        if thing_type_name in known_thing_types:
+            return thing_type_name
+
+        # On first use, learn all the existing thing types with one listing
+        global thing_types_listed
+        if not thing_types_listed:
+            ApiHandlerEndpoint.list_thing_types()
+            thing_types_listed = True
+            if thing_type_name in known_thing_types:
+                return thing_type_name
 
         response = {}
         try:
@@ -233,8 +350,11 @@ class ApiHandlerEndpoint:
                     'thingTypeDescription': thing_type_description
                 }
             )
+            known_thing_types.add(thing_type_name)
         except ClientError as e:
             print(e, e.response)
+            if e.response['Error']['Code'] == 'ResourceAlreadyExistsException':
+                known_thing_types.add(thing_type_name)
 
         print(json.dumps(response))
         return thing_type_name
@@ -251,51 +371,171 @@ class ApiHandlerEndpoint:
                 if endpoint_id == '*':
                     delete_all_sample_endpoints = True
                     break
-                endpoint_ids.append(endpoint_id)
+                # BatchGetItem rejects a request listing the same key twice
+                if endpoint_id not in endpoint_ids:
+                    endpoint_ids.append(endpoint_id)
 
             if delete_all_sample_endpoints is True:
-                self.delete_samples()
-                response = {'message': 'Deleted all sample endpoints'}
-
-            for endpoint_id in endpoint_ids:
-                iot_aws.delete_thing(thingName=endpoint_id)
-                response = dynamodb_aws.delete_item(TableName='SampleEndpointDetails', Key={'EndpointId': endpoint_id})
-                # TODO Check Response
-                # TODO UPDATE ALEXA!
-                # Send AddOrUpdateReport to Alexa Event Gateway
+                response = self.delete_samples()
+                response['message'] = 'Deleted all sample endpoints'
+
+            elif endpoint_ids:
+                # Get the users of the endpoints to tell Alexa about the deletions
+                keys = [{'EndpointId': {'S': endpoint_id}} for endpoint_id in endpoint_ids]
+                items, unprocessed_keys = ApiUtils.batch_get_items(dynamodb_aws, 'SampleEndpointDetails', keys)
+                if unprocessed_keys:
+                    print('WARN api_handler_endpoint.delete: Users unknown, DeleteReport not sent for', [key['EndpointId']['S'] for key in unprocessed_keys])
+                user_ids = dict((item['EndpointId']['S'], item['UserId']['S']) for item in items if 'UserId' in item)
+                response = self.delete_endpoints([(endpoint_id, user_ids.get(endpoint_id)) for endpoint_id in endpoint_ids])
 
             return response
 
         except KeyError as key_error:
             return "KeyError: " + str(key_error)
 
-    def delete_samples(self):
-        table = boto3.resource('dynamodb').Table('SampleEndpointDetails')
-        result = table.scan()
-        items = result['Items']
-        for item in items:
-            endpoint_id = item['EndpointId']
-            self.delete_thing(endpoint_id)
-
-    # TODO Improve response handling
-    @staticmethod
-    def delete_thing(endpoint_id):
+    def delete_endpoints(self, endpoints):
+        """
+        Delete many endpoints, the details are deleted with BatchWriteItem, the things are deleted on a bounded
+        pool of threads and one DeleteReport is sent per user
+        :param endpoints: A list of (endpoint id, user id) tuples, the user id is None when unknown
+        :return: A dict with the result of each endpoint and the HTTP status code, or error, of the event for each user
+        """
+        # Each endpoint is deleted and reported once, however many times it is listed
+        endpoints = list(OrderedDict(endpoints).items())
+        print('LOG api_handler_endpoint.delete_endpoints -----', len(endpoints), 'endpoints')
+        results = dict((endpoint_id, 'OK') for endpoint_id, user_id in endpoints)
 
         # Delete from DynamoDB
-        response = dynamodb_aws.delete_item(
-            TableName='SampleEndpointDetails',
-            Key={'EndpointId': {'S': endpoint_id}}
-        )
-        print('LOG api_handler_endpoint.delete_thing.dynamodb_aws.delete_item.response -----')
-        print(response)
+        write_requests = [{'DeleteRequest': {'Key': {'EndpointId': {'S': endpoint_id}}}} for endpoint_id in results]
+        for write_request in ApiUtils.batch_write_items(dynamodb_aws, 'SampleEndpointDetails', write_requests):
+            results[write_request['DeleteRequest']['Key']['EndpointId']['S']] = 'ERR Could not delete the endpoint details'
+        for endpoint_id in results:
+            capability_cache.invalidate(endpoint_id)
 
         # Delete from AWS IoT
-        response = iot_aws.delete_thing(
-            thingName=endpoint_id
-        )
-        print('LOG api_handler_endpoint.delete_thing.iot_aws.delete_item.response -----')
-        print(response)
-        return response
+        def delete_thing(endpoint_id):
+            try:
+                iot_aws.delete_thing(thingName=endpoint_id)
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                    return 'OK'
+                print('ERR api_handler_endpoint.delete_endpoints.delete_thing', endpoint_id, e)
+                return 'ERR Could not delete the thing'
+            return 'OK'
+
+        endpoint_ids = list(results)
+        for endpoint_id, result in zip(endpoint_ids, provisioning_executor.map(delete_thing, endpoint_ids)):
+            if result != 'OK' and results[endpoint_id] == 'OK':
+                results[endpoint_id] = result
+
+        # Send one Event per user that removes all of their deleted endpoints from Alexa
+        endpoint_ids_by_user = {}
+        for endpoint_id, user_id in endpoints:
+            if user_id is not None and user_id != '0' and results[endpoint_id] == 'OK':
+                endpoint_ids_by_user.setdefault(user_id, []).append(endpoint_id)
+
+        reports = {}
+        api_handler_event = ApiHandlerEvent()
+        for user_id, user_endpoint_ids in endpoint_ids_by_user.items():
+            # The endpoints are deleted, so a failed report is recorded for the user instead of failing the request
+            try:
+                token = api_handler_event.get_user_info(user_id)
+                if token is None:
+                    print('WARN api_handler_endpoint.delete_endpoints: No access token, DeleteReport not sent for user', user_id)
+                    continue
+                response = api_handler_event.send_delete_report(user_endpoint_ids[0], token, user_endpoint_ids)
+            except (ClientError, KeyError) as e:
+                print('ERR api_handler_endpoint.delete_endpoints.DeleteReport: Not sent for user', user_id, e)
+                reports[user_id] = 'ERR Could not send the DeleteReport'
+                continue
+            print('LOG api_handler_endpoint.delete_endpoints.DeleteReport:', response.read().decode('utf-8'))
+            reports[user_id] = response.getcode()
+
+        return {'endpoints': results, 'reports': reports}
+
+    def delete_samples(self):
+        endpoints = []
+        paginator = dynamodb_aws.get_paginator('scan')
+        for page in paginator.paginate(TableName='SampleEndpointDetails', ProjectionExpression='EndpointId, UserId'):
+            for item in page['Items']:
+                user_id = item['UserId']['S'] if 'UserId' in item else None
+                endpoints.append((item['EndpointId']['S'], user_id))
+        return self.delete_endpoints(endpoints)
+
+    @staticmethod
+    def ensure_thing_group():
+        thing_group_name_exists = ApiHandlerEndpoint.check_thing_group_name_exists()
+        if not thing_group_name_exists:
+            response = ApiHandlerEndpoint.create_thing_group(samples_thing_group_name)
+            if not ApiUtils.check_response(response):
+                print('ERR api_handler_endpoint.create.create_thing_group.response', response)
+
+    @staticmethod
+    def get_endpoint_details(endpoint):
+        """
+        Map an endpoint from the body of a create request to its EndpointDetails
+        """
+        endpoint_details = ApiHandlerEndpoint.EndpointDetails()
+        endpoint_details.user_id = endpoint['userId']  # Expect a Profile
+        endpoint_details.capabilities = endpoint['capabilities']
+        endpoint_details.sku = endpoint['sku']  # A custom endpoint type, ex: SW01
+
+        if 'friendlyName' in endpoint:
+            endpoint_details.friendly_name = endpoint['friendlyName']
+
+        if 'manufacturerName' in endpoint:
+            endpoint_details.manufacturer_name = endpoint['manufacturerName']
+
+        if 'description' in endpoint:
+            endpoint_details.description = endpoint['description']
+
+        if 'displayCategories' in endpoint:
+            endpoint_details.display_categories = endpoint['displayCategories']
+
+        return endpoint_details
+
+    @staticmethod
+    def get_thing_details_item(endpoint_details):
+        """
+        :return: The SampleEndpointDetails item for an endpoint in DynamoDB attribute value format
+        """
+        return {
+            'EndpointId': {'S': str(endpoint_details.id)},
+            'Capabilities': {'S': str(json.dumps(endpoint_details.capabilities))},
+            'Description': {'S': str(endpoint_details.description)},
+            'DisplayCategories': {'S': str(json.dumps(endpoint_details.display_categories))},
+            'FriendlyName': {'S': str(endpoint_details.friendly_name)},
+            'ManufacturerName': {'S': str(endpoint_details.manufacturer_name)},
+            'SKU': {'S': str(endpoint_details.sku)},
+            'UserId': {'S': str(endpoint_details.user_id)}
+        }
+
+    @staticmethod
+    def get_thing_type(sku):
+        """
+        :return: The name and description of the ThingType for a SKU
+        """
+        # Set the default at OTHER (OT00)
+        thing_type_name = 'SampleOther'
+        thing_type_description = 'A sample endpoint'
+
+        if sku.upper().startswith('LI'):
+            thing_type_name = 'SampleLight'
+            thing_type_description = 'A sample light endpoint'
+
+        if sku.upper().startswith('MW'):
+            thing_type_name = 'SampleMicrowave'
+            thing_type_description = 'A sample microwave endpoint'
+
+        if sku.upper().startswith('SW'):
+            thing_type_name = 'SampleSwitch'
+            thing_type_description = 'A sample switch endpoint'
+
+        if sku.upper().startswith('TT'):
+            thing_type_name = 'SampleToaster'
+            thing_type_description = 'A sample toaster endpoint'
+
+        return thing_type_name, thing_type_description
 
     def read(self, request):
         try:
@@ -307,15 +547,13 @@ class ApiHandlerEndpoint:
                     endpoint_id = request['queryStringParameters']['endpoint_id']
                     response = self.read_thing(endpoint_id)
                 else:
-                    list_response = iot_aws.list_things()
+                    # Optionally only list the endpoints of one user
+                    user_id = None
+                    if parameters is not None and 'user_id' in parameters:
+                        user_id = parameters['user_id']
                     # TODO List things only in the Samples Thing Group
                     # list_response = iot_aws.list_things_in_thing_group(thingGroupName=thing_group_name)
-                    status = list_response['ResponseMetadata']['HTTPStatusCode']
-                    if 200 <= int(status) < 300:
-                        things = list_response['things']
-                        response = []
-                        for thing in things:
-                            response.append(thing)
+                    response = list(self.list_things(user_id))
 
             print('LOG api_handler_endpoint.read -----')
             print(json.dumps(response))
@@ -327,6 +565,53 @@ class ApiHandlerEndpoint:
         except KeyError as key_error:
             return "KeyError: " + str(key_error)
 
+    @staticmethod
+    def get_capabilities(endpoint_id):
+        """
+        Get the parsed capabilities of an endpoint, reading SampleEndpointDetails only on a cache miss
+        :return: ApiHandlerEndpoint.CapabilityIndex
+        """
+        capability_index = capability_cache.get(endpoint_id)
+        if capability_index is None:
+            result = dynamodb_aws.get_item(
+                TableName='SampleEndpointDetails',
+                Key={'EndpointId': {'S': endpoint_id}},
+                ProjectionExpression='Capabilities'
+            )
+            capabilities = json.loads(result['Item']['Capabilities']['S'])
+            capability_index = ApiHandlerEndpoint.cache_capabilities(endpoint_id, capabilities)
+        return capability_index
+
+    @staticmethod
+    def list_things(user_id=None):
+        """
+        Iterate over every page of AWS IoT things
+        :param user_id: Only yield the things with this user_id attribute, the filter is applied by AWS IoT
+        :return: generator of thing dicts
+        """
+        parameters = {}
+        if user_id is not None:
+            parameters = {'attributeName': 'user_id', 'attributeValue': user_id}
+        paginator = iot_aws.get_paginator('list_things')
+        for page in paginator.paginate(**parameters):
+            for thing in page['things']:
+                yield thing
+
+    @staticmethod
+    def list_thing_types():
+        """
+        Add the usable AWS IoT thing types to known_thing_types, a deprecated type cannot be given to new things
+        """
+        try:
+            paginator = iot_aws.get_paginator('list_thing_types')
+            for page in paginator.paginate():
+                for thing_type in page['thingTypes']:
+                    if not thing_type.get('thingTypeMetadata', {}).get('deprecated', False):
+                        known_thing_types.add(thing_type['thingTypeName'])
+        except ClientError as e:
+            print('WARN api_handler_endpoint.list_thing_types:', e)
+        print('LOG api_handler_endpoint.list_thing_types.known_thing_types:', known_thing_types)
+
     @staticmethod
     def read_thing(endpoint_id):
         return iot_aws.describe_thing(thingName=endpoint_id)
@@ -357,9 +642,10 @@ class ApiHandlerEndpoint:
         # TODO UPDATE ALEXA!
         # Send ChangeReport to Alexa Event Gateway
 
-    def update_thing(self, endpoint_details):
+    def update_thing(self, endpoint_details, thing_type_name=None):
         # Create the ThingType if missing
-        thing_type_name = self.create_thing_type(endpoint_details.sku)
+        if thing_type_name is None:
+            thing_type_name = self.create_thing_type(endpoint_details.sku)
         response = iot_aws.update_thing(
             thingName=endpoint_details.id,
             thingTypeName=thing_type_name,
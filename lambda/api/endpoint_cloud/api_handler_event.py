@@ -11,19 +11,42 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
 
-import http.client
 import json
+import threading
 from datetime import datetime, timedelta
 
-import boto3
 from botocore.exceptions import ClientError
 
 from alexa.skills.smarthome import AlexaResponse
 from .api_auth import ApiAuth
+from .api_cache import ApiCache
+from .api_clients import ApiClients
+from .api_connection_pool import connection_pool
+from .api_event_queue import ApiEventDispatcher
+from .api_shadow_writer import ApiShadowWriter
 
-dynamodb_aws = boto3.client('dynamodb')
-iot_aws = boto3.client('iot')
-iot_data_aws = boto3.client('iot-data')
+iot_data_aws = ApiClients.lazy_client('iot-data')
+
+# Also used by the token refresher in lambda/refresh/index.py, which is packaged on its own and keeps a copy
+EXPIRATION_FORMAT = "%Y-%m-%dT%H:%M:%S.00Z"
+
+# Give a 30 second buffer for expiration
+EXPIRATION_BUFFER = 30
+
+# UserId to access token, entries expire with the token
+access_token_cache = ApiCache(max_size=1024)
+
+# UserId to the lock held while the token of that user is read or refreshed
+refresh_locks = {}
+refresh_locks_lock = threading.Lock()
+
+
+def get_refresh_lock(endpoint_user_id):
+    with refresh_locks_lock:
+        lock = refresh_locks.get(endpoint_user_id)
+        if lock is None:
+            lock = refresh_locks[endpoint_user_id] = threading.Lock()
+        return lock
 
 
 class ApiHandlerEvent:
@@ -35,6 +58,10 @@ class ApiHandlerEvent:
         try:
             json_object = json.loads(request['body'])
 
+            # Several ChangeReports, ex: from a scene changing many lights, can be sent at once as a list of events
+            if 'events' in json_object:
+                return self.create_change_reports(json_object['events'])
+
             # Transpose the Endpoint Cloud Event into an Alexa Event Gateway Event
 
             # Get the common information from the body of the request
@@ -42,101 +69,23 @@ class ApiHandlerEvent:
             endpoint_user_id = json_object['event']['endpoint']['userId']  # Expect a Profile
             endpoint_id = json_object['event']['endpoint']['id']  # Expect a valid AWS IoT Thing Name
 
-            # Get the Access Token
-            token = self.get_user_info(endpoint_user_id)
+            # Get the Access Token, ChangeReports get it when they are dispatched
+            if event_type != 'ChangeReport':
+                token = self.get_user_info(endpoint_user_id)
 
             # Build a default response
             response = AlexaResponse(name='ErrorResponse', message="No valid event type")
 
             if event_type == 'AddOrUpdateReport':
-                # Get the additional information from the body of the request
-                endpoint_friendly_name = json_object['event']['endpoint']['friendlyName']  # Expect a valid string friendly name
-                endpoint_capabilities = json_object['event']['endpoint']['capabilities']  # Expect a valid AWS IoT Thing Name
-                sku = json_object['event']['endpoint']['sku']  # Expect a meaningful type, ex: SW00
-
-                # From the SKU, get the information for the device and combine it in the payload
-                endpoint_sku_details = self.get_sku_details(sku)
-                payload = {
-                    'endpoints': [
-                        {
-                            'endpointId': endpoint_id,
-                            'friendlyName': endpoint_friendly_name,
-                            'description': endpoint_sku_details['description'],
-                            'manufacturerName': endpoint_sku_details['manufacturer_name'],
-                            'displayCategories': endpoint_sku_details['display_categories'],
-                            'capabilities': endpoint_capabilities
-                        }],
-                    'scope': {
-                        'type': 'BearerToken',
-                        'token': token
-                    }
-                }
-
                 # Send an event to Alexa to add/update the endpoint
-                response = self.send_event('Alexa.Discovery', 'AddOrUpdateReport', endpoint_id, token, payload)
+                response = self.send_add_or_update_report(endpoint_id, token, [json_object['event']['endpoint']])
 
             if event_type == 'ChangeReport':
-                try:
-                    state = json_object['event']['endpoint']['state']  # Expect a string, ex: powerState
-                    state_value = json_object['event']['endpoint']['value']  # Expect string or JSON
-                    namespace = json_object['event']['endpoint']['namespace']
-                    instance = json_object['event']['endpoint'].get('instance', None)
-                    if instance:
-                        state = instance+'.'+state
-                        prop = AlexaResponse.create_context_property(instance=instance, namespace=namespace, name=state, value=state_value)
-                    else:
-                        prop = AlexaResponse.create_context_property(namespace=namespace, name=state, value=state_value)
-                    # Update the IoT Thing Shadow state
-                    msg = {
-                        'state': {
-                            'desired':
-                                {
-                                    state: state_value
-                                }
-                        }
-                    }
-                    mqtt_msg = json.dumps(msg)
-                    result = iot_data_aws.update_thing_shadow(
-                        thingName=endpoint_id,
-                        payload=mqtt_msg.encode())
-                    print('LOG event.create.iot_aws.update_thing_shadow.result -----')
-                    print(result)
-
-                    # Update Alexa with an Event Update
-                    if endpoint_user_id == '0':
-                        print('LOG Event: Not sent for user_id of 0')
-                    else:
-                        payload = {
-                            'change': {
-                                'cause': {
-                                    'type': 'PHYSICAL_INTERACTION'
-                                },
-                                "properties": [
-                                    prop
-                                ]
-                            }
-                        }
-                        print('LOG Event: Sending event')
-                        response = self.send_event('Alexa', 'ChangeReport', endpoint_id, token, payload)
-
-                except ClientError as e:
-                    alexa_response = AlexaResponse(name='ErrorResponse', message=e, payload={'type': 'INTERNAL_ERROR', 'message': e})
-                    return alexa_response.get()
+                return self.create_change_reports([json_object['event']])
 
             if event_type == 'DeleteReport':
                 # Send an event to Alexa to delete the endpoint
-                payload = {
-                    'endpoints': [
-                        {
-                            'endpointId': endpoint_id
-                        }
-                    ],
-                    "scope": {
-                        "type": "BearerToken",
-                        "token": token
-                    }
-                }
-                response = self.send_event('Alexa.Discovery', 'DeleteReport', endpoint_id, token, payload)
+                response = self.send_delete_report(endpoint_id, token, [endpoint_id])
 
             result = response.read().decode('utf-8')
             print('LOG event.create.result -----')
@@ -146,6 +95,105 @@ class ApiHandlerEvent:
         except KeyError as key_error:
             return "KeyError: " + str(key_error)
 
+    def create_change_reports(self, events):
+        """
+        Update the thing shadows and send the ChangeReports for one or more endpoints before returning
+        Changes to the same endpoint are combined into one shadow update and one ChangeReport
+        :param events: Endpoint Cloud ChangeReport events
+        :return: The JSON result of each endpoint, SENT, NOT_SENT or FAILED, and the shadow update errors
+        """
+        shadow_writer = ApiShadowWriter(iot_data_aws.update_thing_shadow)
+        event_dispatcher = ApiEventDispatcher(self.send_change_report)
+        changes = []
+        for event in events:
+            endpoint_user_id = event['endpoint']['userId']
+            endpoint_id = event['endpoint']['id']
+            state = event['endpoint']['state']  # Expect a string, ex: powerState
+            state_value = event['endpoint']['value']  # Expect string or JSON
+            namespace = event['endpoint']['namespace']
+            instance = event['endpoint'].get('instance', None)
+            if instance:
+                state = instance+'.'+state
+                prop = AlexaResponse.create_context_property(instance=instance, namespace=namespace, name=state, value=state_value)
+            else:
+                prop = AlexaResponse.create_context_property(namespace=namespace, name=state, value=state_value)
+            shadow_writer.update(endpoint_id, {state: state_value})
+            changes.append((endpoint_user_id, endpoint_id, prop))
+
+        # Update the IoT Thing Shadow states first, Alexa is only told of a change the shadow holds
+        errors = shadow_writer.flush()
+
+        # Update Alexa with an Event Update
+        results = {}
+        for endpoint_user_id, endpoint_id, prop in changes:
+            if endpoint_id in errors:
+                results[endpoint_id] = 'FAILED'
+            elif endpoint_user_id == '0':
+                print('LOG Event: Not sent for user_id of 0')
+                results[endpoint_id] = 'NOT_SENT'
+            else:
+                event_dispatcher.enqueue(endpoint_user_id, endpoint_id, prop)
+
+        print('LOG Event: Sending events')
+        results.update(event_dispatcher.flush())
+        print('LOG event.create_change_reports.results:', results)
+        if 'FAILED' in results.values():
+            result = 'FAILED'
+        elif 'SENT' in results.values():
+            result = 'SENT'
+        else:
+            result = 'NOT_SENT'
+        response = {'result': result, 'endpoints': results}
+        if errors:
+            response['errors'] = {thing_name: str(error) for thing_name, error in errors.items()}
+        return json.dumps(response)
+
+    def send_add_or_update_report(self, endpoint_id, token, endpoints):
+        """
+        Send one AddOrUpdateReport listing several endpoints of the same user
+        :param endpoint_id: The endpoint the event is sent for
+        :param token: The access token of the user
+        :param endpoints: Endpoint Cloud endpoints, each with an id, friendlyName, sku and capabilities
+        :return: The response from the Alexa Event Gateway
+        """
+        payload_endpoints = []
+        for endpoint in endpoints:
+            # From the SKU, get the information for the device and combine it in the payload
+            endpoint_sku_details = self.get_sku_details(endpoint['sku'])  # Expect a meaningful type, ex: SW00
+            payload_endpoints.append({
+                'endpointId': endpoint['id'],  # Expect a valid AWS IoT Thing Name
+                'friendlyName': endpoint['friendlyName'],  # Expect a valid string friendly name
+                'description': endpoint_sku_details['description'],
+                'manufacturerName': endpoint_sku_details['manufacturer_name'],
+                'displayCategories': endpoint_sku_details['display_categories'],
+                'capabilities': endpoint['capabilities']
+            })
+        payload = {
+            'endpoints': payload_endpoints,
+            'scope': {
+                'type': 'BearerToken',
+                'token': token
+            }
+        }
+        return self.send_event('Alexa.Discovery', 'AddOrUpdateReport', endpoint_id, token, payload)
+
+    def send_delete_report(self, endpoint_id, token, endpoint_ids):
+        """
+        Send one DeleteReport listing several endpoints of the same user
+        :param endpoint_id: The endpoint the event is sent for
+        :param token: The access token of the user
+        :param endpoint_ids: The ids of the deleted endpoints
+        :return: The response from the Alexa Event Gateway
+        """
+        payload = {
+            'endpoints': [{'endpointId': deleted_endpoint_id} for deleted_endpoint_id in endpoint_ids],
+            "scope": {
+                "type": "BearerToken",
+                "token": token
+            }
+        }
+        return self.send_event('Alexa.Discovery', 'DeleteReport', endpoint_id, token, payload)
+
     # TODO Improve this with a database lookup
     @staticmethod
     def get_sku_details(sku):
@@ -172,8 +220,49 @@ class ApiHandlerEvent:
         return sku_details
 
     def get_user_info(self, endpoint_user_id):
+        """
+        Get a current access token for a user, refreshing it when it is about to expire
+        Tokens are cached until they expire and only one refresh per user runs at a time in the container
+        :param endpoint_user_id: The UserId in the SampleUsers table
+        :return: The access token, None if the user is not found
+        """
         print('LOG event.create.get_user_info -----')
-        table = boto3.resource('dynamodb').Table('SampleUsers')
+        access_token = access_token_cache.get(endpoint_user_id)
+        if access_token is not None:
+            print('LOG event.create.get_user_info.access_token_cache:', access_token_cache.stats())
+            return access_token
+
+        with get_refresh_lock(endpoint_user_id):
+            # Another thread may have refreshed the token while this one waited
+            access_token = access_token_cache.get(endpoint_user_id)
+            if access_token is not None:
+                return access_token
+
+            table = ApiClients.table('SampleUsers')
+            item = self.get_user_item(table, endpoint_user_id)
+            if item is None:
+                return None
+
+            if 'ExpirationUTC' in item:
+                expiration_utc = item['ExpirationUTC']
+                token_is_expired = self.is_token_expired(expiration_utc)
+            else:
+                token_is_expired = True
+            print('LOG event.create.send_event.token_is_expired:', token_is_expired)
+            if token_is_expired:
+                item = self.refresh_user_token(table, item)
+                # TODO Return an error here if the token could not be refreshed
+                if item is None:
+                    return None
+            else:
+                print('LOG Using stored access_token:', item['AccessToken'])
+
+            access_token = item['AccessToken']
+            access_token_cache.put(endpoint_user_id, access_token, ttl=self.get_token_lifetime(item['ExpirationUTC']))
+            return access_token
+
+    @staticmethod
+    def get_user_item(table, endpoint_user_id):
         result = table.get_item(
             Key={
                 'UserId': endpoint_user_id
@@ -187,81 +276,106 @@ class ApiHandlerEvent:
                 'RedirectUri',
                 'RefreshToken',
                 'TokenType'
-            ]
+            ],
+            ConsistentRead=True
         )
 
-        if result['ResponseMetadata']['HTTPStatusCode'] == 200:
-            if 'Item' in result:
-                print('LOG event.create.get_user_info.SampleUsers.get_item -----')
-                print(str(result['Item']))
-                if 'ExpirationUTC' in result['Item']:
-                    expiration_utc = result['Item']['ExpirationUTC']
-                    token_is_expired = self.is_token_expired(expiration_utc)
-                else:
-                    token_is_expired = True
-                print('LOG event.create.send_event.token_is_expired:', token_is_expired)
-                if token_is_expired:
-                    # The token has expired so get a new access token using the refresh token
-                    refresh_token = result['Item']['RefreshToken']
-                    client_id = result['Item']['ClientId']
-                    client_secret = result['Item']['ClientSecret']
-                    redirect_uri = result['Item']['RedirectUri']
-
-                    api_auth = ApiAuth()
-                    response_refresh_token = api_auth.refresh_access_token(refresh_token, client_id, client_secret, redirect_uri)
-                    response_refresh_token_string = response_refresh_token.read().decode('utf-8')
-                    response_refresh_token_object = json.loads(response_refresh_token_string)
-
-                    # Store the new values from the refresh
-                    access_token = response_refresh_token_object['access_token']
-                    refresh_token = response_refresh_token_object['refresh_token']
-                    token_type = response_refresh_token_object['token_type']
-                    expires_in = response_refresh_token_object['expires_in']
-
-                    # Calculate expiration
-                    expiration_utc = datetime.utcnow() + timedelta(seconds=(int(expires_in) - 5))
-
-                    print('access_token', access_token)
-                    print('expiration_utc', expiration_utc)
-
-                    result = table.update_item(
-                        Key={
-                            'UserId': endpoint_user_id
-                        },
-                        UpdateExpression="set AccessToken=:a, RefreshToken=:r, TokenType=:t, ExpirationUTC=:e",
-                        ExpressionAttributeValues={
-                            ':a': access_token,
-                            ':r': refresh_token,
-                            ':t': token_type,
-                            ':e': expiration_utc.strftime("%Y-%m-%dT%H:%M:%S.00Z")
-                        },
-                        ReturnValues="UPDATED_NEW"
-                    )
-                    print('LOG event.create.send_event.SampleUsers.update_item:', str(result))
-
-                    # TODO Return an error here if the token could not be refreshed
-                else:
-                    # Use the stored access token
-                    access_token = result['Item']['AccessToken']
-                    print('LOG Using stored access_token:', access_token)
+        if result['ResponseMetadata']['HTTPStatusCode'] == 200 and 'Item' in result:
+            print('LOG event.create.get_user_info.SampleUsers.get_item -----')
+            print(str(result['Item']))
+            return result['Item']
+        return None
+
+    def refresh_user_token(self, table, item):
+        """
+        Get a new access token using the refresh token and store it
+        The write is conditional on the stored token expiring before the new one, so a slower refresh
+        elsewhere never overwrites a fresher token
+        The token refresher in lambda/refresh/index.py (refresh_user) makes the same request and write, keep them in sync
+        :param item: The SampleUsers item with the expired token
+        :return: The item holding the token to use
+        """
+        api_auth = ApiAuth()
+        response_refresh_token = api_auth.refresh_access_token(item['RefreshToken'], item['ClientId'], item['ClientSecret'], item['RedirectUri'])
+        response_refresh_token_string = response_refresh_token.read().decode('utf-8')
+        response_refresh_token_object = json.loads(response_refresh_token_string)
+
+        # Store the new values from the refresh
+        access_token = response_refresh_token_object['access_token']
+        refresh_token = response_refresh_token_object['refresh_token']
+        token_type = response_refresh_token_object['token_type']
+        expires_in = response_refresh_token_object['expires_in']
+
+        # Calculate expiration
+        expiration_utc = datetime.utcnow() + timedelta(seconds=(int(expires_in) - 5))
+        expiration_utc = expiration_utc.strftime(EXPIRATION_FORMAT)
+
+        print('access_token', access_token)
+        print('expiration_utc', expiration_utc)
 
-                return access_token
+        try:
+            result = table.update_item(
+                Key={
+                    'UserId': item['UserId']
+                },
+                UpdateExpression="set AccessToken=:a, RefreshToken=:r, TokenType=:t, ExpirationUTC=:e",
+                ConditionExpression="attribute_not_exists(ExpirationUTC) OR ExpirationUTC < :e",
+                ExpressionAttributeValues={
+                    ':a': access_token,
+                    ':r': refresh_token,
+                    ':t': token_type,
+                    ':e': expiration_utc
+                },
+                ReturnValues="UPDATED_NEW"
+            )
+            print('LOG event.create.send_event.SampleUsers.update_item:', str(result))
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            # A fresher token was stored by another refresh, use that one
+            print('LOG event.refresh_user_token: Stored token is newer, reading it')
+            return self.get_user_item(table, item['UserId'])
+
+        refreshed_item = dict(item)
+        refreshed_item.update(AccessToken=access_token, RefreshToken=refresh_token, TokenType=token_type, ExpirationUTC=expiration_utc)
+        return refreshed_item
 
     @staticmethod
-    def is_token_expired(expiration_utc):
+    def get_token_lifetime(expiration_utc):
+        """
+        :return: The seconds left before the token should be refreshed, can be negative
+        """
+        then = datetime.strptime(expiration_utc, EXPIRATION_FORMAT)
         now = datetime.utcnow().replace(tzinfo=None)
-        then = datetime.strptime(expiration_utc, "%Y-%m-%dT%H:%M:%S.00Z")
-        is_expired = now > then
-        if is_expired:
-            return is_expired
-        seconds = (now - then).seconds
-        is_soon = seconds < 30  # Give a 30 second buffer for expiration
-        return is_soon
+        return (then - now).total_seconds() - EXPIRATION_BUFFER
+
+    @staticmethod
+    def is_token_expired(expiration_utc):
+        return ApiHandlerEvent.get_token_lifetime(expiration_utc) <= 0
+
+    def send_change_report(self, endpoint_user_id, endpoint_id, properties):
+        """
+        Send a ChangeReport for one or more changed properties of an endpoint
+        :return: The HTTP status code from the Alexa Event Gateway
+        """
+        token = self.get_user_info(endpoint_user_id)
+        payload = {
+            'change': {
+                'cause': {
+                    'type': 'PHYSICAL_INTERACTION'
+                },
+                "properties": properties
+            }
+        }
+        print('LOG Event: Sending event')
+        response = self.send_event('Alexa', 'ChangeReport', endpoint_id, token, payload)
+        print('LOG event.send_change_report.result:', response.read().decode('utf-8'))
+        return response.getcode()
 
     @staticmethod
     def send_event(alexa_namespace, alexa_name, endpoint_id, token, payload):
 
-        remove_endpoint = alexa_name is not "ChangeReport"
+        remove_endpoint = alexa_name != "ChangeReport"
         alexa_response = AlexaResponse(namespace=alexa_namespace, name=alexa_name, endpoint_id=endpoint_id, token=token, remove_endpoint=remove_endpoint)
         alexa_response.set_payload(payload)
         payload = json.dumps(alexa_response.get())
@@ -271,13 +385,11 @@ class ApiHandlerEvent:
         # TODO Map to correct endpoint for Europe: https://api.eu.amazonalexa.com/v3/events
         # TODO Map to correct endpoint for Far East: https://api.fe.amazonalexa.com/v3/events
         alexa_event_gateway_uri = 'api.amazonalexa.com'
-        connection = http.client.HTTPSConnection(alexa_event_gateway_uri)
         headers = {
             'Authorization': "Bearer " + token,
             'Content-Type': "application/json;charset=UTF-8",
             'Cache-Control': "no-cache"
         }
-        connection.request('POST', '/v3/events', payload, headers)
-        response = connection.getresponse()
+        response = connection_pool.request(alexa_event_gateway_uri, 'POST', '/v3/events', payload, headers)
         print('LOG api_handler_event.send_event HTTP Status code: ' + str(response.getcode()))
         return response
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in
+# compliance with the License. A copy of the License is located at
+#
+#    http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import json
+import time
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+
+class ApiShadowWriter:
+    """
+    Combines the desired state updates to a thing shadow made while handling one request into one update
+    The latest value of a property wins, the combined updates are written when flushed, before the handler returns
+    Updates are not held over a time window: Lambda gives each container one request at a time and freezes it once
+    the handler returns, so a window could never combine updates from separate /events calls and pending writes
+    could be lost. A device sweeping a value sends its changes as one list of events to have them combined
+    """
+
+    def __init__(self, update_thing_shadow, max_attempts=3, backoff=0.1):
+        """
+        :param update_thing_shadow: A function of (thingName, payload), ex: the boto3 iot-data update_thing_shadow
+        :param max_attempts: The number of times a combined update is written before it is given up
+        :param backoff: The delay before the first retry in seconds, doubled on every following attempt
+        """
+        self.update_thing_shadow = update_thing_shadow
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._pending = OrderedDict()
+
+    def update(self, thing_name, desired):
+        """
+        Combine a desired state update for a thing into its pending update
+        :param desired: A dict of shadow property to value
+        """
+        self._pending.setdefault(thing_name, {}).update(desired)
+
+    def flush(self):
+        """
+        Write the pending updates
+        :return: A dict of thing name to the ClientError of each update that could not be written
+        """
+        pending, self._pending = self._pending, OrderedDict()
+        errors = {}
+        for thing_name, desired in pending.items():
+            error = self.write(thing_name, desired)
+            if error is not None:
+                errors[thing_name] = error
+        return errors
+
+    def write(self, thing_name, desired):
+        """
+        :return: None once the update is written, or the ClientError of the last attempt
+        """
+        msg = {'state': {'desired': desired}}
+        for attempt in range(self.max_attempts):
+            try:
+                result = self.update_thing_shadow(thingName=thing_name, payload=json.dumps(msg).encode())
+                print('LOG api_shadow_writer.write.update_thing_shadow.result -----')
+                print(result)
+                return None
+            except ClientError as e:
+                print('ERR api_shadow_writer.write ClientError:', e)
+                error = e
+                if attempt + 1 < self.max_attempts:
+                    time.sleep(self.backoff * (2 ** attempt))
+        print('ERR api_shadow_writer.write: Could not update', thing_name, desired)
+        return error
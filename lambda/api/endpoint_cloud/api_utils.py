@@ -14,10 +14,71 @@
 import datetime
 import random
 import string
+import time
+
+# The most keys DynamoDB accepts in a single BatchGetItem request
+DYNAMODB_BATCH_GET_LIMIT = 100
+
+# The most requests DynamoDB accepts in a single BatchWriteItem request
+DYNAMODB_BATCH_WRITE_LIMIT = 25
 
 
 class ApiUtils:
 
+    @staticmethod
+    def batch_get_items(dynamodb_client, table_name, keys, max_retries=5):
+        """
+        Get items with BatchGetItem, chunked to the request limit and retrying unprocessed keys with backoff
+        :param dynamodb_client: A boto3 DynamoDB client
+        :param table_name: The table to read from
+        :param keys: A list of DynamoDB keys, ex: {'EndpointId': {'S': 'SAMPLE_ENDPOINT_1'}}
+        :param max_retries: The number of times to retry unprocessed keys for each chunk
+        :return: list of items, in no particular order, and list of the keys that were still unprocessed after the retries
+        """
+        items = []
+        unprocessed = []
+        for start in range(0, len(keys), DYNAMODB_BATCH_GET_LIMIT):
+            request_items = {table_name: {'Keys': keys[start:start + DYNAMODB_BATCH_GET_LIMIT]}}
+            retries = 0
+            while request_items:
+                response = dynamodb_client.batch_get_item(RequestItems=request_items)
+                items.extend(response['Responses'].get(table_name, []))
+                request_items = response.get('UnprocessedKeys')
+                if request_items:
+                    if retries >= max_retries:
+                        print('ERR ApiUtils.batch_get_items unprocessed keys after retries:', request_items)
+                        unprocessed.extend(request_items[table_name]['Keys'])
+                        break
+                    time.sleep(0.05 * (2 ** retries))
+                    retries += 1
+        return items, unprocessed
+
+    @staticmethod
+    def batch_write_items(dynamodb_client, table_name, write_requests, max_retries=5):
+        """
+        Put or delete items with BatchWriteItem, chunked to the request limit and retrying unprocessed items with backoff
+        :param dynamodb_client: A boto3 DynamoDB client
+        :param table_name: The table to write to
+        :param write_requests: A list of DynamoDB write requests, ex: {'DeleteRequest': {'Key': {'EndpointId': {'S': 'SAMPLE_ENDPOINT_1'}}}}
+        :param max_retries: The number of times to retry unprocessed items for each chunk
+        :return: list of the write requests that were still unprocessed after the retries
+        """
+        unprocessed = []
+        for start in range(0, len(write_requests), DYNAMODB_BATCH_WRITE_LIMIT):
+            request_items = {table_name: write_requests[start:start + DYNAMODB_BATCH_WRITE_LIMIT]}
+            retries = 0
+            while request_items:
+                response = dynamodb_client.batch_write_item(RequestItems=request_items)
+                request_items = response.get('UnprocessedItems')
+                if request_items:
+                    if retries >= max_retries:
+                        print('ERR ApiUtils.batch_write_items unprocessed items after retries:', request_items)
+                        unprocessed.extend(request_items.get(table_name, []))
+                        break
+                    time.sleep(0.05 * (2 ** retries))
+                    retries += 1
+        return unprocessed
+
     @staticmethod
     def check_response(response):
         if response is None:
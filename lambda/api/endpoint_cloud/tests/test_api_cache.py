@@ -0,0 +1,93 @@
+import io
+import json
+import unittest
+from unittest import mock
+
+from endpoint_cloud import api_auth, api_cache
+from endpoint_cloud.api_auth import ApiAuth
+from endpoint_cloud.api_cache import ApiCache
+
+
+class TestApiCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patch_time = mock.patch.object(api_cache.time, "monotonic", lambda: self.now)
+        patch_time.start()
+        self.addCleanup(patch_time.stop)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ApiCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire_after_their_ttl(self):
+        cache = ApiCache(ttl=10)
+        cache.put("a", 1)
+        cache.put("b", 2, ttl=30)
+        self.now += 10
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+        self.now += 20
+        self.assertEqual(cache.get("b", "gone"), "gone")
+        self.assertEqual(len(cache), 0)
+
+    def test_entries_without_a_ttl_never_expire(self):
+        cache = ApiCache()
+        cache.put("a", 1)
+        self.now += 10 ** 6
+        self.assertEqual(cache.get("a"), 1)
+
+    def test_stats(self):
+        cache = ApiCache(max_size=1, ttl=5)
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("b")
+        cache.put("b", 2)
+        self.now += 5
+        cache.get("b")
+        self.assertEqual(
+            cache.stats(), {"size": 0, "hits": 1, "misses": 2, "evictions": 1},
+        )
+
+    def test_invalidate_and_clear(self):
+        cache = ApiCache()
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.invalidate("a")
+        cache.invalidate("missing")
+        self.assertIsNone(cache.get("a"))
+        cache.clear()
+        self.assertIsNone(cache.get("b"))
+
+
+class TestUserProfileCache(unittest.TestCase):
+    def setUp(self):
+        api_auth.user_profile_cache.clear()
+        self.addCleanup(api_auth.user_profile_cache.clear)
+        patch_get_user_id = mock.patch.object(ApiAuth, "get_user_id")
+        self.get_user_id = patch_get_user_id.start()
+        self.addCleanup(patch_get_user_id.stop)
+
+    def respond(self, profile):
+        self.get_user_id.side_effect = lambda token: io.BytesIO(json.dumps(profile).encode("utf-8"))
+
+    def test_profiles_are_cached_by_token(self):
+        self.respond({"user_id": "amzn1.account.1"})
+        for _ in range(3):
+            self.assertEqual(ApiAuth.get_user_profile("token"), {"user_id": "amzn1.account.1"})
+        self.get_user_id.assert_called_once_with("token")
+
+    def test_errors_are_not_cached(self):
+        self.respond({"error": "invalid_token"})
+        ApiAuth.get_user_profile("token")
+        ApiAuth.get_user_profile("token")
+        self.assertEqual(self.get_user_id.call_count, 2)
+
+    def test_profiles_expire_well_before_the_token(self):
+        self.assertLess(api_auth.USER_PROFILE_TTL, 3600)
+        self.assertEqual(api_auth.user_profile_cache.ttl, api_auth.USER_PROFILE_TTL)
@@ -0,0 +1,113 @@
+import http.client
+import socket
+import unittest
+
+from endpoint_cloud.api_connection_pool import ApiConnectionPool
+
+
+class FakeResponse(object):
+    def __init__(self, status=200, body=b"{}", will_close=False):
+        self.status = status
+        self.reason = "OK"
+        self.body = body
+        self.will_close = will_close
+
+    def getheaders(self):
+        return [("Content-Type", "application/json")]
+
+    def read(self):
+        return self.body
+
+
+class FakeConnection(object):
+    """
+    A connection over one end of a socket pair, closing the other end makes it look closed by the server
+    """
+
+    def __init__(self, responses):
+        self.sock, self.peer = socket.socketpair()
+        self.responses = list(responses)
+        self.requests = []
+        self.closed = False
+
+    def request(self, method, url, body, headers):
+        self.requests.append((method, url))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+
+    def getresponse(self):
+        return self.responses.pop(0)
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+        self.peer.close()
+
+
+class TestApiConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = ApiConnectionPool()
+        self.addCleanup(self.pool.clear)
+        self.pool._connect = self.fake_connect
+        self.connections = []
+
+    def connect(self, *responses):
+        self.connections.append(FakeConnection(responses))
+
+    def fake_connect(self, host):
+        self.pool._count("created")
+        connection = self.connections.pop(0)
+        self.addCleanup(connection.close)
+        return connection
+
+    def request(self, method="GET"):
+        return self.pool.request("api.amazon.com", method, "/user/profile")
+
+    def test_idle_connections_are_reused(self):
+        self.connect(None, FakeResponse(body=b"1"), None, FakeResponse(body=b"2"))
+        self.assertEqual(self.request().read(), b"1")
+        self.assertEqual(self.request().read(), b"2")
+        self.assertEqual(
+            (self.pool.metrics["created"], self.pool.metrics["reused"]), (1, 1),
+        )
+
+    def test_connections_closed_by_the_server_are_not_reused(self):
+        self.connect(None, FakeResponse())
+        self.connect(None, FakeResponse())
+        self.request()
+        stale = self.pool._idle["api.amazon.com"][0][0]
+        stale.peer.close()
+        self.request()
+        self.assertTrue(stale.closed)
+        self.assertEqual(
+            (self.pool.metrics["created"], self.pool.metrics["expired"]), (2, 1),
+        )
+
+    def test_responses_that_close_are_not_pooled(self):
+        self.connect(None, FakeResponse(will_close=True))
+        self.request()
+        self.assertEqual(self.pool._idle, {})
+
+    def test_idempotent_requests_are_retried_on_a_stale_connection(self):
+        self.connect(None, FakeResponse(), http.client.BadStatusLine(""))
+        self.connect(None, FakeResponse(body=b"retried"))
+        self.request()
+        self.assertEqual(self.request().read(), b"retried")
+        self.assertEqual(self.pool.metrics["reconnected"], 1)
+
+    def test_other_requests_are_not_retried_on_a_stale_connection(self):
+        self.connect(None, FakeResponse(), ConnectionResetError())
+        self.connect(None, FakeResponse())
+        self.request("POST")
+        with self.assertRaises(ConnectionResetError):
+            self.request("POST")
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(self.pool.metrics["errors"], 1)
+
+    def test_new_connections_are_not_retried(self):
+        self.connect(http.client.BadStatusLine(""))
+        self.connect(None, FakeResponse())
+        with self.assertRaises(http.client.BadStatusLine):
+            self.request()
+        self.assertEqual(len(self.connections), 1)
@@ -0,0 +1,71 @@
+import threading
+import unittest
+from unittest import mock
+
+from endpoint_cloud import api_event_queue
+from endpoint_cloud.api_event_queue import ApiEventDispatcher
+
+
+def prop(name, value, namespace="Alexa.BrightnessController"):
+    return {"namespace": namespace, "name": name, "value": value}
+
+
+class TestApiEventDispatcher(unittest.TestCase):
+    def setUp(self):
+        patch_sleep = mock.patch.object(api_event_queue.time, "sleep")
+        self.sleep = patch_sleep.start()
+        self.addCleanup(patch_sleep.stop)
+        self.sent = []
+        self.statuses = {}
+        self.lock = threading.Lock()
+        self.dispatcher = ApiEventDispatcher(self.send)
+
+    def send(self, user_id, endpoint_id, properties):
+        with self.lock:
+            self.sent.append((user_id, endpoint_id, properties))
+            statuses = self.statuses.get(endpoint_id)
+            return statuses.pop(0) if statuses else 202
+
+    def test_changes_to_an_endpoint_are_combined(self):
+        self.dispatcher.enqueue("user", "light", prop("brightness", 10))
+        self.dispatcher.enqueue("user", "light", prop("powerState", "ON", "Alexa.PowerController"))
+        self.dispatcher.enqueue("user", "light", prop("brightness", 40))
+        self.assertEqual(len(self.dispatcher), 1)
+        self.assertEqual(self.dispatcher.flush(), {"light": "SENT"})
+        self.assertEqual(
+            self.sent,
+            [("user", "light", [prop("powerState", "ON", "Alexa.PowerController"), prop("brightness", 40)])],
+        )
+        self.assertEqual(len(self.dispatcher), 0)
+
+    def test_each_endpoint_gets_its_own_change_report(self):
+        for endpoint_id in ("one", "two", "three"):
+            self.dispatcher.enqueue("user", endpoint_id, prop("brightness", 1))
+        results = self.dispatcher.flush()
+        self.assertEqual(results, {"one": "SENT", "two": "SENT", "three": "SENT"})
+        self.assertEqual(sorted(endpoint_id for _, endpoint_id, _ in self.sent), ["one", "three", "two"])
+
+    def test_failures_are_retried_after_a_backoff(self):
+        self.statuses["light"] = [500, 503]
+        self.dispatcher.enqueue("user", "light", prop("brightness", 1))
+        self.dispatcher.enqueue("user", "switch", prop("brightness", 1))
+        self.assertEqual(self.dispatcher.flush(), {"light": "SENT", "switch": "SENT"})
+        self.assertEqual([endpoint_id for _, endpoint_id, _ in self.sent].count("light"), 3)
+        self.assertEqual([endpoint_id for _, endpoint_id, _ in self.sent].count("switch"), 1)
+        self.assertEqual([call[0][0] for call in self.sleep.call_args_list], [0.1, 0.2])
+
+    def test_change_reports_fail_after_max_attempts(self):
+        self.statuses["light"] = [500] * 5
+        self.dispatcher.enqueue("user", "light", prop("brightness", 1))
+        self.assertEqual(self.dispatcher.flush(), {"light": "FAILED"})
+        self.assertEqual(len(self.sent), self.dispatcher.max_attempts)
+
+    def test_exceptions_from_send_count_as_failures(self):
+        dispatcher = ApiEventDispatcher(mock.Mock(side_effect=KeyError("access_token")), max_attempts=2)
+        dispatcher.enqueue("user", "light", prop("brightness", 1))
+        self.assertEqual(dispatcher.flush(), {"light": "FAILED"})
+        self.assertEqual(dispatcher.send.call_count, 2)
+
+    def test_flush_with_nothing_queued(self):
+        self.assertEqual(self.dispatcher.flush(), {})
+        self.assertEqual(self.sent, [])
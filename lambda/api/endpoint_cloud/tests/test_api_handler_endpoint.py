@@ -0,0 +1,148 @@
+import json
+import unittest
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from endpoint_cloud import api_handler_endpoint
+from endpoint_cloud.api_handler_endpoint import ApiHandlerEndpoint
+from endpoint_cloud.api_handler_event import ApiHandlerEvent
+
+OK = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "Operation")
+
+
+class EndpointHandlerTestCase(unittest.TestCase):
+    """
+    Stubs the AWS IoT and DynamoDB clients and the Alexa events of ApiHandlerEndpoint
+    """
+
+    def setUp(self):
+        self.iot = mock.Mock()
+        self.dynamodb = mock.Mock()
+        self.dynamodb.batch_write_item.return_value = {"UnprocessedItems": {}}
+        self.get_user_info = mock.Mock(return_value="token")
+        response = mock.Mock()
+        response.read.return_value = b"{}"
+        response.getcode.return_value = 202
+        self.event_response = response
+        for target, name, value in (
+            (api_handler_endpoint, "iot_aws", self.iot),
+            (api_handler_endpoint, "dynamodb_aws", self.dynamodb),
+            (ApiHandlerEvent, "get_user_info", self.get_user_info),
+        ):
+            patch = mock.patch.object(target, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def written(self, request_type):
+        return [
+            write_request[request_type]
+            for call in self.dynamodb.batch_write_item.call_args_list
+            for write_request in call[1]["RequestItems"]["SampleEndpointDetails"]
+        ]
+
+
+class TestCreateEndpoints(EndpointHandlerTestCase):
+    def setUp(self):
+        super(TestCreateEndpoints, self).setUp()
+        self.iot.create_thing.side_effect = self.create_thing
+        self.iot.add_thing_to_thing_group.return_value = OK
+        self.send_add_or_update_report = mock.Mock(return_value=self.event_response)
+        for name, value in (
+            ("ensure_thing_group", mock.Mock()),
+            ("create_thing_type", mock.Mock(return_value="SampleSwitch")),
+        ):
+            patch = mock.patch.object(ApiHandlerEndpoint, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+        patch = mock.patch.object(ApiHandlerEvent, "send_add_or_update_report", self.send_add_or_update_report)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    @staticmethod
+    def create_thing(thingName, thingTypeName, attributePayload):
+        user_id = attributePayload["attributes"]["user_id"]
+        if user_id == "broken":
+            raise client_error("InvalidRequestException")
+        if user_id == "existing":
+            raise client_error("ResourceAlreadyExistsException")
+        return OK
+
+    def create(self, *user_ids):
+        endpoints = [
+            {"userId": user_id, "sku": "SW01", "capabilities": [], "friendlyName": "Switch %d" % i}
+            for i, user_id in enumerate(user_ids)
+        ]
+        return ApiHandlerEndpoint().create_endpoints(endpoints)
+
+    def test_details_are_only_stored_for_created_things(self):
+        result = self.create("user", "broken", "user")
+        self.assertEqual(
+            sorted(result["endpoints"].values()), ["ERR Could not create the thing", "OK", "OK"],
+        )
+        self.assertEqual(
+            [item["Item"]["FriendlyName"]["S"] for item in self.written("PutRequest")], ["Switch 0", "Switch 2"],
+        )
+        self.assertEqual(result["reports"], {"user": 202})
+        self.assertEqual(len(self.send_add_or_update_report.call_args[0][2]), 2)
+
+    def test_a_failed_update_of_an_existing_thing_is_recorded(self):
+        self.iot.update_thing.side_effect = client_error("InvalidRequestException")
+        result = self.create("user", "existing")
+        self.assertEqual(
+            sorted(result["endpoints"].values()), ["ERR Could not create the thing", "OK"],
+        )
+        self.assertEqual(len(self.written("PutRequest")), 1)
+        self.assertEqual(result["reports"], {"user": 202})
+
+    def test_a_failed_report_keeps_the_endpoint_results(self):
+        self.get_user_info.side_effect = KeyError("access_token")
+        result = self.create("user", "user")
+        self.assertEqual(list(result["endpoints"].values()), ["OK", "OK"])
+        self.assertEqual(result["reports"], {"user": "ERR Could not send the AddOrUpdateReport"})
+
+
+class TestDeleteEndpoints(EndpointHandlerTestCase):
+    def setUp(self):
+        super(TestDeleteEndpoints, self).setUp()
+        self.dynamodb.batch_get_item.side_effect = lambda RequestItems: {
+            "Responses": {
+                "SampleEndpointDetails": [
+                    {"EndpointId": key["EndpointId"], "UserId": {"S": "user"}}
+                    for key in RequestItems["SampleEndpointDetails"]["Keys"]
+                ],
+            },
+        }
+        self.send_delete_report = mock.Mock(return_value=self.event_response)
+        patch = mock.patch.object(ApiHandlerEvent, "send_delete_report", self.send_delete_report)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def delete(self, *endpoint_ids):
+        return ApiHandlerEndpoint().delete({"body": json.dumps(list(endpoint_ids))})
+
+    def test_repeated_endpoint_ids_are_deleted_once(self):
+        result = self.delete("one", "two", "one", "one")
+        self.assertEqual(
+            self.dynamodb.batch_get_item.call_args[1]["RequestItems"]["SampleEndpointDetails"]["Keys"],
+            [{"EndpointId": {"S": "one"}}, {"EndpointId": {"S": "two"}}],
+        )
+        self.assertEqual([request["Key"]["EndpointId"]["S"] for request in self.written("DeleteRequest")], ["one", "two"])
+        self.assertEqual(sorted(call[1]["thingName"] for call in self.iot.delete_thing.call_args_list), ["one", "two"])
+        self.assertEqual(self.send_delete_report.call_args[0][2], ["one", "two"])
+        self.assertEqual(result, {"endpoints": {"one": "OK", "two": "OK"}, "reports": {"user": 202}})
+
+    def test_repeated_endpoints_are_reported_once(self):
+        result = ApiHandlerEndpoint().delete_endpoints([("one", "user"), ("one", "user"), ("two", None)])
+        self.assertEqual(result["endpoints"], {"one": "OK", "two": "OK"})
+        self.assertEqual(self.send_delete_report.call_args[0][2], ["one"])
+
+    def test_a_failed_report_keeps_the_endpoint_results(self):
+        self.get_user_info.side_effect = client_error("ProvisionedThroughputExceededException")
+        result = self.delete("one", "two")
+        self.assertEqual(result["endpoints"], {"one": "OK", "two": "OK"})
+        self.assertEqual(result["reports"], {"user": "ERR Could not send the DeleteReport"})
@@ -0,0 +1,67 @@
+import json
+import unittest
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from endpoint_cloud import api_shadow_writer
+from endpoint_cloud.api_shadow_writer import ApiShadowWriter
+
+
+def throttled():
+    return ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "UpdateThingShadow")
+
+
+class TestApiShadowWriter(unittest.TestCase):
+    def setUp(self):
+        patch_sleep = mock.patch.object(api_shadow_writer.time, "sleep")
+        self.sleep = patch_sleep.start()
+        self.addCleanup(patch_sleep.stop)
+        self.update_thing_shadow = mock.Mock(return_value={})
+        self.writer = ApiShadowWriter(self.update_thing_shadow)
+
+    def written(self):
+        return [
+            (call[1]["thingName"], json.loads(call[1]["payload"].decode("utf-8")))
+            for call in self.update_thing_shadow.call_args_list
+        ]
+
+    def fail_for(self, thing_name, error):
+        if thing_name == "light":
+            raise error
+        return {}
+
+    def test_updates_to_a_thing_are_merged(self):
+        self.writer.update("light", {"brightness": 10})
+        self.writer.update("light", {"powerState": "ON"})
+        self.writer.update("light", {"brightness": 40})
+        self.writer.update("switch", {"powerState": "OFF"})
+        self.assertEqual(self.writer.flush(), {})
+        self.assertEqual(
+            self.written(),
+            [
+                ("light", {"state": {"desired": {"brightness": 40, "powerState": "ON"}}}),
+                ("switch", {"state": {"desired": {"powerState": "OFF"}}}),
+            ],
+        )
+
+    def test_flush_writes_each_update_once(self):
+        self.writer.update("light", {"brightness": 10})
+        self.writer.flush()
+        self.assertEqual(self.writer.flush(), {})
+        self.assertEqual(self.update_thing_shadow.call_count, 1)
+
+    def test_failed_writes_are_retried(self):
+        self.update_thing_shadow.side_effect = [throttled(), {}]
+        self.writer.update("light", {"brightness": 10})
+        self.assertEqual(self.writer.flush(), {})
+        self.assertEqual(self.update_thing_shadow.call_count, 2)
+        self.assertEqual(self.sleep.call_count, 1)
+
+    def test_errors_are_returned_after_max_attempts(self):
+        error = throttled()
+        self.update_thing_shadow.side_effect = lambda **kwargs: self.fail_for(kwargs["thingName"], error)
+        self.writer.update("light", {"brightness": 10})
+        self.writer.update("switch", {"powerState": "OFF"})
+        self.assertEqual(self.writer.flush(), {"light": error})
+        self.assertEqual([thing_name for thing_name, _ in self.written()].count("light"), self.writer.max_attempts)
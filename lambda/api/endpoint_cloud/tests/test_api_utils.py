@@ -0,0 +1,73 @@
+import unittest
+from unittest import mock
+
+from endpoint_cloud import api_utils
+from endpoint_cloud.api_utils import ApiUtils
+
+
+def keys(count):
+    return [{"EndpointId": {"S": "SAMPLE_ENDPOINT_%d" % i}} for i in range(count)]
+
+
+class TestBatchItems(unittest.TestCase):
+    def setUp(self):
+        patch_sleep = mock.patch.object(api_utils.time, "sleep")
+        self.sleep = patch_sleep.start()
+        self.addCleanup(patch_sleep.stop)
+        self.client = mock.Mock()
+
+    def test_batch_get_items_is_chunked(self):
+        self.client.batch_get_item.side_effect = lambda RequestItems: {
+            "Responses": {"Table": RequestItems["Table"]["Keys"]},
+        }
+        items, unprocessed = ApiUtils.batch_get_items(self.client, "Table", keys(250))
+        self.assertEqual(items, keys(250))
+        self.assertEqual(unprocessed, [])
+        self.assertEqual(
+            [len(call[1]["RequestItems"]["Table"]["Keys"]) for call in self.client.batch_get_item.call_args_list],
+            [100, 100, 50],
+        )
+
+    def test_batch_get_items_retries_unprocessed_keys(self):
+        self.client.batch_get_item.side_effect = [
+            {"Responses": {"Table": keys(3)[:2]}, "UnprocessedKeys": {"Table": {"Keys": keys(3)[2:]}}},
+            {"Responses": {"Table": keys(3)[2:]}},
+        ]
+        items, unprocessed = ApiUtils.batch_get_items(self.client, "Table", keys(3))
+        self.assertEqual(items, keys(3))
+        self.assertEqual(unprocessed, [])
+        self.assertEqual(
+            self.client.batch_get_item.call_args_list[1][1]["RequestItems"], {"Table": {"Keys": keys(3)[2:]}},
+        )
+        self.assertEqual(self.sleep.call_count, 1)
+
+    def test_batch_get_items_returns_keys_left_unprocessed(self):
+        self.client.batch_get_item.return_value = {
+            "Responses": {}, "UnprocessedKeys": {"Table": {"Keys": keys(2)}},
+        }
+        items, unprocessed = ApiUtils.batch_get_items(self.client, "Table", keys(2), max_retries=2)
+        self.assertEqual((items, unprocessed), ([], keys(2)))
+        self.assertEqual(self.client.batch_get_item.call_count, 3)
+
+    def test_batch_write_items_is_chunked(self):
+        self.client.batch_write_item.return_value = {"UnprocessedItems": {}}
+        requests = [{"DeleteRequest": {"Key": key}} for key in keys(60)]
+        self.assertEqual(ApiUtils.batch_write_items(self.client, "Table", requests), [])
+        self.assertEqual(
+            [len(call[1]["RequestItems"]["Table"]) for call in self.client.batch_write_item.call_args_list],
+            [25, 25, 10],
+        )
+
+    def test_batch_write_items_retries_and_returns_unprocessed_items(self):
+        requests = [{"DeleteRequest": {"Key": key}} for key in keys(3)]
+        self.client.batch_write_item.side_effect = [
+            {"UnprocessedItems": {"Table": requests[1:]}},
+            {"UnprocessedItems": {"Table": requests[2:]}},
+            {"UnprocessedItems": {"Table": requests[2:]}},
+        ]
+        unprocessed = ApiUtils.batch_write_items(self.client, "Table", requests, max_retries=2)
+        self.assertEqual(unprocessed, requests[2:])
+        self.assertEqual(
+            [call[1]["RequestItems"]["Table"] for call in self.client.batch_write_item.call_args_list],
+            [requests, requests[1:], requests[2:]],
+        )
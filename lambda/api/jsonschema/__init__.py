@@ -9,6 +9,7 @@ instance under a schema, and will create a validator for you.
 
 """
 
+from jsonschema._compiler import CompiledValidator
 from jsonschema.exceptions import (
     ErrorTree, FormatError, RefResolutionError, SchemaError, ValidationError
 )
@@ -0,0 +1,583 @@
+"""
+Compile a schema into plain Python functions for fast boolean validation.
+
+Walking a schema through :meth:`iter_errors` creates a generator and looks up
+every keyword on every call. :class:`CompiledValidator` instead generates one
+function per subschema, with ``$ref`` resolved once and each keyword turned
+into straight line checks, and only walks the schema the normal way when an
+instance is invalid and errors have to be reported.
+
+"""
+
+import functools
+import numbers
+import re
+
+from jsonschema import _utils, _validators
+from jsonschema.compat import iteritems, str_types, urljoin
+from jsonschema.exceptions import RefResolutionError
+
+
+def _candidates(instance, functions, table):
+    indices = _utils.discriminate(instance, table)
+    if indices is None:
+        return functions
+    return [functions[index] for index in indices]
+
+
+def _one_of(instance, functions):
+    found = False
+    for function in functions:
+        if function(instance):
+            if found:
+                return False
+            found = True
+    return found
+
+
+def _valid(instance):
+    return True
+
+
+def _search(pattern):
+    try:
+        return _utils.compile_pattern(pattern).search
+    except re.error:
+        # Fail when the pattern is used, like the uncompiled validator does
+        return functools.partial(re.search, pattern)
+
+
+class _Compiler(object):
+    """
+    Generates the source of the validation functions for a validator.
+
+    """
+
+    def __init__(self, validator):
+        self.validator = validator
+        self.namespace = {
+            u"_candidates": _candidates,
+            u"_is_type": validator.is_type,
+            u"_is_valid": validator.is_valid,
+            u"_marked": validator._marked,
+            u"_one_of": _one_of,
+            u"_uniq": _utils.uniq,
+            u"_valid": _valid,
+            u"_validator": validator,
+        }
+        self.functions = {}
+        self.pending = []
+        self.schemas = []
+        self.source = []
+        self.emitters = {
+            _validators.additionalItems: self.additionalItems,
+            _validators.additionalProperties: self.additionalProperties,
+            _validators.allOf_draft4: self.allOf,
+            _validators.anyOf_draft4: self.anyOf,
+            _validators.dependencies: self.dependencies,
+            _validators.enum: self.enum,
+            _validators.format: self.format,
+            _validators.items: self.items,
+            _validators.maxItems: self.maxItems,
+            _validators.maxLength: self.maxLength,
+            _validators.maxProperties_draft4: self.maxProperties,
+            _validators.maximum: self.maximum,
+            _validators.minItems: self.minItems,
+            _validators.minLength: self.minLength,
+            _validators.minProperties_draft4: self.minProperties,
+            _validators.minimum: self.minimum,
+            _validators.multipleOf: self.multipleOf,
+            _validators.not_draft4: self.not_,
+            _validators.oneOf_draft4: self.oneOf,
+            _validators.pattern: self.pattern,
+            _validators.patternProperties: self.patternProperties,
+            _validators.properties_draft4: self.properties,
+            _validators.required_draft4: self.required,
+            _validators.type_draft4: self.type,
+            _validators.uniqueItems: self.uniqueItems,
+        }
+
+    def compile(self):
+        resolver = self.validator.resolver
+        entry = self.function_for(
+            self.validator.schema, resolver.resolution_scope,
+        )
+        while self.pending:
+            name, schema, scope = self.pending.pop()
+            self.source.extend(self.function_source(name, schema, scope))
+            self.source.append(u"")
+
+        source = u"\n".join(self.source)
+        code = compile(
+            source, u"<compiled schema>", u"exec", dont_inherit=True,
+        )
+        exec(code, self.namespace)
+        return source, self.namespace.get(entry, _valid)
+
+    def constant(self, value):
+        name = u"_c%d" % len(self.namespace)
+        self.namespace[name] = value
+        return name
+
+    def function_for(self, schema, scope):
+        if self.is_trivial(schema):
+            return u"_valid"
+
+        key = id(schema), scope
+        name = self.functions.get(key)
+        if name is None:
+            name = u"_v%d" % len(self.functions)
+            self.functions[key] = name
+            # Keep the schema alive so its id is not reused during compiling
+            self.schemas.append(schema)
+            self.pending.append((name, schema, scope))
+        return name
+
+    def function_source(self, name, schema, scope):
+        lines = [u"def %s(i):" % (name,)]
+
+        if not isinstance(schema, dict):
+            lines.append(
+                u"    return _is_valid(i, %s)" % (self.constant(schema),),
+            )
+            return lines
+
+        id_scope = schema.get(u"id")
+        if id_scope:
+            scope = urljoin(scope, id_scope)
+
+        ref = schema.get(u"$ref")
+        if ref is not None and u"$ref" in self.validator.VALIDATORS:
+            lines.append(u"    return %s(i)" % (self.ref(ref, scope),))
+            return lines
+
+        for k, v in iteritems(schema):
+            function = self.validator.VALIDATORS.get(k)
+            if function is None:
+                continue
+            emitter = self.emitters.get(function)
+            if emitter is None:
+                body = self.fallback(function, v, schema)
+            else:
+                body = emitter(v, schema, scope)
+            lines.extend(u"    " + line for line in body)
+
+        lines.append(u"    return True")
+        return lines
+
+    def fallback(self, function, value, schema):
+        # A keyword added with extend, run through its validator function
+        errors = u"%s(_validator, %s, i, %s) or ()" % (
+            self.constant(function),
+            self.constant(value),
+            self.constant(schema),
+        )
+        return [
+            u"if next(iter(%s), None) is not None:" % (errors,),
+            u"    return False",
+        ]
+
+    def is_trivial(self, schema):
+        if not isinstance(schema, dict):
+            return False
+        if u"$ref" in schema and u"$ref" in self.validator.VALIDATORS:
+            return False
+        return not any(k in self.validator.VALIDATORS for k in schema)
+
+    def is_type(self, type, var=u"i"):
+        """
+        An expression checking the type of ``var``, like :meth:`is_type`.
+
+        """
+
+        types = self.validator._types
+        if type not in types:
+            return u"_is_type(%s, %s)" % (var, self.constant(type))
+
+        pytypes = types[type]
+        name = self.constant(pytypes)
+        flat = _utils.flatten(pytypes)
+        is_number = any(issubclass(pytype, numbers.Number) for pytype in flat)
+        if is_number and bool not in flat:
+            return u"(isinstance(%s, %s) and not isinstance(%s, bool))" % (
+                var, name, var,
+            )
+        return u"isinstance(%s, %s)" % (var, name)
+
+    def ref(self, ref, scope):
+        resolver = self.validator.resolver
+        resolver.push_scope(scope)
+        try:
+            url, resolved = resolver.resolve(ref)
+        except RefResolutionError as error:
+            name = u"_v%d" % len(self.functions)
+            self.functions[object()] = name
+            self.source.extend([
+                u"def %s(i):" % (name,),
+                u"    raise %s" % (self.constant(error),),
+                u"",
+            ])
+            return name
+        finally:
+            resolver.pop_scope()
+        return self.function_for(resolved, urljoin(scope, url))
+
+    def additionalItems(self, aI, schema, scope):
+        if self.validator.is_type(schema.get(u"items", {}), u"object"):
+            return []
+
+        len_items = len(schema.get(u"items", []))
+        if self.validator.is_type(aI, u"object"):
+            function = self.function_for(aI, scope)
+            if function == u"_valid":
+                return []
+            return [
+                u"if %s:" % (self.is_type(u"array"),),
+                u"    for x in i[%d:]:" % (len_items,),
+                u"        if not %s(x):" % (function,),
+                u"            return False",
+            ]
+        if not aI:
+            return [
+                u"if %s and len(i) > %d:" % (
+                    self.is_type(u"array"), len_items,
+                ),
+                u"    return False",
+            ]
+        return []
+
+    def additionalProperties(self, aP, schema, scope):
+        properties = self.constant(frozenset(schema.get(u"properties", {})))
+        patterns = u"|".join(schema.get(u"patternProperties", {}))
+        if patterns:
+            extra = u"k not in %s and not %s(k)" % (
+                properties, self.constant(_search(patterns)),
+            )
+        else:
+            extra = u"k not in %s" % (properties,)
+
+        if self.validator.is_type(aP, u"object"):
+            function = self.function_for(aP, scope)
+            if function == u"_valid":
+                return []
+            return [
+                u"if %s:" % (self.is_type(u"object"),),
+                u"    for k in i:",
+                u"        if %s and not %s(i[k]):" % (extra, function),
+                u"            return False",
+            ]
+        if not aP:
+            return [
+                u"if %s:" % (self.is_type(u"object"),),
+                u"    for k in i:",
+                u"        if %s:" % (extra,),
+                u"            return False",
+            ]
+        return []
+
+    def allOf(self, allOf, schema, scope):
+        lines = []
+        for subschema in allOf:
+            function = self.function_for(subschema, scope)
+            if function != u"_valid":
+                lines.extend([
+                    u"if not %s(i):" % (function,),
+                    u"    return False",
+                ])
+        return lines
+
+    def anyOf(self, anyOf, schema, scope):
+        functions = [self.function_for(each, scope) for each in anyOf]
+        if u"_valid" in functions:
+            return []
+        candidates = self.candidates(anyOf, functions, scope)
+        if candidates is not None:
+            return [
+                u"if not any(f(i) for f in %s):" % (candidates,),
+                u"    return False",
+            ]
+        return [
+            u"if not (%s):" % (
+                u" or ".join(u"%s(i)" % (each,) for each in functions) or
+                u"False",
+            ),
+            u"    return False",
+        ]
+
+    def candidates(self, subschemas, functions, scope):
+        """
+        An expression for the branches left by the validator's discriminators.
+
+        """
+
+        discriminator_table = getattr(
+            self.validator, u"discriminator_table", None,
+        )
+        if discriminator_table is None or not self.validator.discriminators:
+            return None
+        self.validator.resolver.push_scope(scope)
+        try:
+            table = discriminator_table(subschemas)
+        finally:
+            self.validator.resolver.pop_scope()
+        if not table:
+            return None
+        return u"_candidates(i, (%s), %s)" % (
+            u"".join(u"%s, " % (each,) for each in functions),
+            self.constant(table),
+        )
+
+    def dependencies(self, dependencies, schema, scope):
+        lines = [u"if %s:" % (self.is_type(u"object"),)]
+        for property, dependency in iteritems(dependencies):
+            name = self.constant(property)
+            if self.validator.is_type(dependency, u"object"):
+                function = self.function_for(dependency, scope)
+                if function == u"_valid":
+                    continue
+                lines.extend([
+                    u"    if %s in i and not %s(i):" % (name, function),
+                    u"        return False",
+                ])
+            else:
+                dependency = _utils.ensure_list(dependency)
+                lines.extend([
+                    u"    if %s in i and not all(d in i for d in %s):" % (
+                        name, self.constant(tuple(dependency)),
+                    ),
+                    u"        return False",
+                ])
+        return lines if len(lines) > 1 else []
+
+    def enum(self, enums, schema, scope):
+        return [
+            u"if i not in %s:" % (self.constant(enums),),
+            u"    return False",
+        ]
+
+    def format(self, format, schema, scope):
+        if self.validator.format_checker is None:
+            return []
+        return [
+            u"if not %s(i, %s):" % (
+                self.constant(self.validator.format_checker.conforms),
+                self.constant(format),
+            ),
+            u"    return False",
+        ]
+
+    def items(self, items, schema, scope):
+        if self.validator.is_type(items, u"object"):
+            function = self.function_for(items, scope)
+            if function == u"_valid":
+                return []
+            # Skip the items marked valid by the validator's mark_valid
+            marked = u"_marked and (id(x), %s) in _marked" % (
+                self.constant(id(items)),
+            )
+            return [
+                u"if %s:" % (self.is_type(u"array"),),
+                u"    for x in i:",
+                u"        if not (%s) and not %s(x):" % (marked, function),
+                u"            return False",
+            ]
+
+        lines = [u"if %s:" % (self.is_type(u"array"),)]
+        for index, subschema in enumerate(items):
+            function = self.function_for(subschema, scope)
+            if function == u"_valid":
+                continue
+            lines.extend([
+                u"    if len(i) > %d and not %s(i[%d]):" % (
+                    index, function, index,
+                ),
+                u"        return False",
+            ])
+        return lines if len(lines) > 1 else []
+
+    def length(self, type, comparison, value):
+        return [
+            u"if %s and len(i) %s %s:" % (
+                self.is_type(type), comparison, self.constant(value),
+            ),
+            u"    return False",
+        ]
+
+    def maxItems(self, mI, schema, scope):
+        return self.length(u"array", u">", mI)
+
+    def maxLength(self, mL, schema, scope):
+        return self.length(u"string", u">", mL)
+
+    def maxProperties(self, mP, schema, scope):
+        return self.length(u"object", u">", mP)
+
+    def minItems(self, mI, schema, scope):
+        return self.length(u"array", u"<", mI)
+
+    def minLength(self, mL, schema, scope):
+        return self.length(u"string", u"<", mL)
+
+    def minProperties(self, mP, schema, scope):
+        return self.length(u"object", u"<", mP)
+
+    def maximum(self, maximum, schema, scope):
+        if schema.get(u"exclusiveMaximum", False):
+            comparison = u">="
+        else:
+            comparison = u">"
+        return [
+            u"if %s and i %s %s:" % (
+                self.is_type(u"number"), comparison, self.constant(maximum),
+            ),
+            u"    return False",
+        ]
+
+    def minimum(self, minimum, schema, scope):
+        if schema.get(u"exclusiveMinimum", False):
+            comparison = u"<="
+        else:
+            comparison = u"<"
+        return [
+            u"if %s and i %s %s:" % (
+                self.is_type(u"number"), comparison, self.constant(minimum),
+            ),
+            u"    return False",
+        ]
+
+    def multipleOf(self, dB, schema, scope):
+        name = self.constant(dB)
+        if isinstance(dB, float):
+            return [
+                u"if %s:" % (self.is_type(u"number"),),
+                u"    q = i / %s" % (name,),
+                u"    if int(q) != q:",
+                u"        return False",
+            ]
+        return [
+            u"if %s and i %% %s:" % (self.is_type(u"number"), name),
+            u"    return False",
+        ]
+
+    def not_(self, not_schema, schema, scope):
+        return [
+            u"if %s(i):" % (self.function_for(not_schema, scope),),
+            u"    return False",
+        ]
+
+    def oneOf(self, oneOf, schema, scope):
+        functions = [self.function_for(each, scope) for each in oneOf]
+        candidates = self.candidates(oneOf, functions, scope)
+        if candidates is None:
+            candidates = u"(%s)" % (
+                u"".join(u"%s, " % (each,) for each in functions),
+            )
+        return [
+            u"if not _one_of(i, %s):" % (candidates,),
+            u"    return False",
+        ]
+
+    def pattern(self, patrn, schema, scope):
+        return [
+            u"if %s and not %s(i):" % (
+                self.is_type(u"string"), self.constant(_search(patrn)),
+            ),
+            u"    return False",
+        ]
+
+    def patternProperties(self, patternProperties, schema, scope):
+        lines = [u"if %s:" % (self.is_type(u"object"),)]
+        for pattern, subschema in iteritems(patternProperties):
+            function = self.function_for(subschema, scope)
+            if function == u"_valid":
+                continue
+            lines.extend([
+                u"    for k in i:",
+                u"        if %s(k) and not %s(i[k]):" % (
+                    self.constant(_search(pattern)), function,
+                ),
+                u"            return False",
+            ])
+        return lines if len(lines) > 1 else []
+
+    def properties(self, properties, schema, scope):
+        lines = [u"if %s:" % (self.is_type(u"object"),)]
+        for property, subschema in iteritems(properties):
+            function = self.function_for(subschema, scope)
+            if function == u"_valid":
+                continue
+            name = self.constant(property)
+            lines.extend([
+                u"    if %s in i and not %s(i[%s]):" % (name, function, name),
+                u"        return False",
+            ])
+        return lines if len(lines) > 1 else []
+
+    def required(self, required, schema, scope):
+        if not required:
+            return []
+        return [
+            u"if %s and not (%s):" % (
+                self.is_type(u"object"),
+                u" and ".join(
+                    u"%s in i" % (self.constant(each),) for each in required
+                ),
+            ),
+            u"    return False",
+        ]
+
+    def type(self, types, schema, scope):
+        types = _utils.ensure_list(types)
+        if not all(isinstance(type, str_types) for type in types):
+            return self.fallback(_validators.type_draft4, types, schema)
+        return [
+            u"if not (%s):" % (
+                u" or ".join(self.is_type(type) for type in types) or u"False",
+            ),
+            u"    return False",
+        ]
+
+    def uniqueItems(self, uI, schema, scope):
+        if not uI:
+            return []
+        return [
+            u"if %s and not _uniq(i):" % (self.is_type(u"array"),),
+            u"    return False",
+        ]
+
+
+class CompiledValidator(object):
+    """
+    Wrap a validator with a compiled boolean check of its schema.
+
+    :meth:`is_valid` only runs the compiled functions. :meth:`iter_errors` and
+    :meth:`validate` run them first and fall back to the wrapped validator
+    for invalid instances, so the errors are exactly the ones it reports.
+
+    Arguments:
+
+        validator:
+
+            The validator to compile, ex: a :class:`Draft4Validator`
+
+    """
+
+    def __init__(self, validator):
+        self.validator = validator
+        self.source, self._is_valid = _Compiler(validator).compile()
+
+    @property
+    def schema(self):
+        return self.validator.schema
+
+    def is_valid(self, instance):
+        return self._is_valid(instance)
+
+    def iter_errors(self, instance):
+        if self._is_valid(instance):
+            return iter(())
+        return self.validator.iter_errors(instance)
+
+    def validate(self, instance):
+        if not self._is_valid(instance):
+            self.validator.validate(instance)
@@ -2,6 +2,7 @@ import datetime
 import re
 import socket
 
+from jsonschema import _utils
 from jsonschema.compat import str_types
 from jsonschema.exceptions import FormatError
 
@@ -227,7 +228,7 @@ else:
 def is_regex(instance):
     if not isinstance(instance, str_types):
         return True
-    return re.compile(instance)
+    return _utils.compile_pattern(instance)
 
 
 @_checks_drafts(draft3="date", raises=ValueError)
@@ -1,21 +1,32 @@
 import itertools
 import json
+import numbers
 import pkgutil
 import re
 
-from jsonschema.compat import str_types, MutableMapping, urlsplit
+from jsonschema.compat import (
+    str_types, int_types, MutableMapping, lru_cache, urlsplit,
+)
+
+
+# The types of the values json.loads returns
+_JSON_TYPES = (dict, list, bool, float, type(None)) + str_types + int_types
 
 
 class URIDict(MutableMapping):
     """
     Dictionary which uses normalized URIs as keys.
 
+    ``changes`` counts the writes and deletes, so that caches built from the
+    contents can tell when they are stale.
+
     """
 
     def normalize(self, uri):
         return urlsplit(uri).geturl()
 
     def __init__(self, *args, **kwargs):
+        self.changes = 0
         self.store = dict()
         self.store.update(*args, **kwargs)
 
@@ -24,9 +35,11 @@ class URIDict(MutableMapping):
 
     def __setitem__(self, uri, value):
         self.store[self.normalize(uri)] = value
+        self.changes += 1
 
     def __delitem__(self, uri):
         del self.store[self.normalize(uri)]
+        self.changes += 1
 
     def __iter__(self):
         return iter(self.store)
@@ -86,6 +99,21 @@ def format_as_index(indices):
     return "[%s]" % "][".join(repr(index) for index in indices)
 
 
+@lru_cache(maxsize=1024)
+def compile_pattern(pattern):
+    """
+    Compile a regular expression, keeping the most recently used ones.
+
+    Shared by the ``pattern``, ``patternProperties`` and
+    ``additionalProperties`` keywords and the ``regex`` format, so each
+    pattern is compiled once rather than looked up by :func:`re.search` on
+    every check.
+
+    """
+
+    return re.compile(pattern)
+
+
 def find_additional_properties(instance, schema):
     """
     Return the set of additional properties for the given ``instance``.
@@ -101,7 +129,7 @@ def find_additional_properties(instance, schema):
     patterns = "|".join(schema.get("patternProperties", {}))
     for property in instance:
         if property not in properties:
-            if patterns and re.search(patterns, property):
+            if patterns and compile_pattern(patterns).search(property):
                 continue
             yield property
 
@@ -162,6 +190,79 @@ def flatten(suitable_for_isinstance):
     return tuple(types)
 
 
+def discriminate(instance, table):
+    """
+    Find the branches whose discriminator values allow the given ``instance``.
+
+    ``table`` is a list of ``(path, values)`` pairs, with one entry in
+    ``values`` per branch holding the values allowed at ``path``, or ``None``
+    if the branch allows any value there.
+
+    Returns the indices of the remaining branches, or ``None`` if the instance
+    has no hashable value at any of the paths.
+
+    """
+
+    candidates = None
+    for path, values in table:
+        value = instance
+        for part in path:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            try:
+                matches = [
+                    index for index, allowed in enumerate(values)
+                    if allowed is None or value in allowed
+                ]
+            except TypeError:
+                continue
+            if candidates is None:
+                candidates = matches
+            else:
+                candidates = [i for i in candidates if i in matches]
+    return candidates
+
+
+def type_checker(pytypes):
+    """
+    Make a function checking whether an instance is of the given types.
+
+    bool inherits from int, so unless ``bool`` itself is one of the types,
+    bools are not reported as being of numeric types.
+
+    The result for each of the builtin types JSON decodes to is worked out
+    up front, so checks against abstract types like :class:`numbers.Number` do
+    not go through ``__instancecheck__`` for every instance.
+
+    """
+
+    flat = flatten(pytypes)
+    is_number = any(issubclass(pytype, numbers.Number) for pytype in flat)
+    excludes_bool = is_number and bool not in flat
+
+    def check(instance):
+        if excludes_bool and isinstance(instance, bool):
+            return False
+        return isinstance(instance, pytypes)
+
+    known = dict(
+        (json_type, issubclass(json_type, pytypes))
+        for json_type in _JSON_TYPES
+    )
+    if excludes_bool:
+        known[bool] = False
+
+    def check_known(instance):
+        result = known.get(instance.__class__)
+        if result is None:
+            return check(instance)
+        return result
+
+    return check_known
+
+
 def ensure_list(thing):
     """
     Wrap ``thing`` in a list if it's a single str.
@@ -175,6 +276,33 @@ def ensure_list(thing):
     return thing
 
 
+def intersect(allowed, other):
+    """
+    Combine two sets of allowed values, where ``None`` allows any value.
+
+    """
+
+    if allowed is None:
+        return other
+    if other is None:
+        return allowed
+    return allowed & other
+
+
+def freeze(element):
+    """
+    A hashable stand-in for a JSON value, equal to another exactly when the
+    values are equal.
+
+    """
+
+    if isinstance(element, dict):
+        return frozenset((k, freeze(v)) for k, v in element.items())
+    elif isinstance(element, list):
+        return tuple(freeze(each) for each in element)
+    return element
+
+
 def unbool(element, true=object(), false=object()):
     """
     A hack to make True and 1 and False and 0 unique for ``uniq``.
@@ -193,13 +321,21 @@ def uniq(container):
     Check if all of a container's elements are unique.
 
     Successively tries first to rely that the elements are hashable, then
-    falls back on them being sortable, and finally falls back on brute
-    force.
+    on hashable stand-ins for objects and arrays, then falls back on them
+    being sortable, and finally falls back on brute force.
 
     """
 
     try:
         return len(set(unbool(i) for i in container)) == len(container)
+    except TypeError:
+        pass
+
+    try:
+        # Objects and arrays compare equal exactly when these hashable
+        # stand-ins do, so a list of objects is checked in linear time
+        unique = set(unbool(freeze(i)) for i in container)
+        return len(unique) == len(container)
     except TypeError:
         try:
             sort = sorted(unbool(i) for i in container)
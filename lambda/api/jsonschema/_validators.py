@@ -1,5 +1,3 @@
-import re
-
 from jsonschema import _utils
 from jsonschema.exceptions import FormatError, ValidationError
 from jsonschema.compat import iteritems
@@ -11,7 +9,7 @@ def patternProperties(validator, patternProperties, instance, schema):
 
     for pattern, subschema in iteritems(patternProperties):
         for k, v in iteritems(instance):
-            if re.search(pattern, k):
+            if _utils.compile_pattern(pattern).search(k):
                 for error in validator.descend(
                     v, subschema, path=k, schema_path=pattern,
                 ):
@@ -152,7 +150,7 @@ def uniqueItems(validator, uI, instance, schema):
 def pattern(validator, patrn, instance, schema):
     if (
         validator.is_type(instance, "string") and
-        not re.search(patrn, instance)
+        not _utils.compile_pattern(patrn).search(instance)
     ):
         yield ValidationError("%r does not match %r" % (instance, patrn))
 
@@ -334,7 +332,24 @@ def allOf_draft4(validator, allOf, instance, schema):
             yield error
 
 
+def _discriminate(validator, instance, subschemas):
+    discriminate = getattr(validator, "discriminate", None)
+    if discriminate is None:
+        return None
+    return discriminate(instance, subschemas)
+
+
 def oneOf_draft4(validator, oneOf, instance, schema):
+    candidates = _discriminate(validator, instance, oneOf)
+    if candidates is not None:
+        # The other branches cannot match, so one valid candidate is enough
+        valid = [
+            index for index in candidates
+            if validator.is_valid(instance, oneOf[index])
+        ]
+        if len(valid) == 1:
+            return
+
     subschemas = enumerate(oneOf)
     all_errors = []
     for index, subschema in subschemas:
@@ -359,6 +374,12 @@ def oneOf_draft4(validator, oneOf, instance, schema):
 
 
 def anyOf_draft4(validator, anyOf, instance, schema):
+    candidates = _discriminate(validator, instance, anyOf)
+    if candidates is not None and any(
+        validator.is_valid(instance, anyOf[index]) for index in candidates
+    ):
+        return
+
     all_errors = []
     for index, subschema in enumerate(anyOf):
         errs = list(validator.descend(instance, subschema, schema_path=index))
@@ -0,0 +1,4 @@
+"""
+Benchmarks for validation performance.
+
+"""
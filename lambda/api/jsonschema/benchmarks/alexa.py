@@ -0,0 +1,360 @@
+"""
+Time validation of generated Alexa smart home messages.
+
+Runs :meth:`iter_errors`, :meth:`is_valid` and :meth:`check_schema` of a
+:class:`Draft4Validator`, and :meth:`CompiledValidator.is_valid`, against
+``alexa_smart_home_message_schema.json`` with StateReport, ChangeReport and
+Discover.Response payloads, and writes the results as JSON so that runs can be
+compared over time::
+
+    python -m jsonschema.benchmarks.alexa --output baseline.json
+
+The validators are set up the way ``get_response_validator`` in
+``endpoint_cloud/api_handler_directive.py`` sets them up, with the references
+resolved ahead of time and the same discriminators. The ``response`` benchmark
+times the whole check of a response, including checking and marking each
+Discover.Response endpoint as it is added.
+
+The payloads are generated from a fixed seed, so every run validates the same
+instances.
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+
+from jsonschema import (
+    CompiledValidator, Draft4Validator, RefResolver, __version__,
+)
+
+
+SCHEMA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__),
+    ))),
+    "alexa_smart_home_message_schema.json",
+)
+
+TIMESTAMP = "2018-01-01T12:00:00.00Z"
+
+ENDPOINT_COUNTS = (1, 50, 300)
+
+# The header name and error type pick the branch of the schema's oneOf lists
+DISCRIMINATORS = [("event", "header", "name"), ("payload", "type")]
+
+DISCOVER_RESPONSE = "A Discover.Response message"
+
+
+def _header(namespace, name, correlation_token=True):
+    header = {
+        "namespace": namespace,
+        "name": name,
+        "payloadVersion": "3",
+        "messageId": "abc-123-def-456-%06d" % random.randint(0, 999999),
+    }
+    if correlation_token:
+        header["correlationToken"] = "dFMb0z+PgpgdDmluhJ1LddFvSqZ/jCc8ptlAKul"
+    return header
+
+
+def _endpoint(endpoint_id):
+    return {
+        "scope": {"type": "BearerToken", "token": "access-token-from-skill"},
+        "endpointId": endpoint_id,
+    }
+
+
+def _properties():
+    return [
+        {
+            "namespace": "Alexa.PowerController",
+            "name": "powerState",
+            "value": random.choice(["ON", "OFF"]),
+            "timeOfSample": TIMESTAMP,
+            "uncertaintyInMilliseconds": 0,
+        },
+        {
+            "namespace": "Alexa.BrightnessController",
+            "name": "brightness",
+            "value": random.randint(0, 100),
+            "timeOfSample": TIMESTAMP,
+            "uncertaintyInMilliseconds": 500,
+        },
+        {
+            "namespace": "Alexa.EndpointHealth",
+            "name": "connectivity",
+            "value": {"value": "OK"},
+            "timeOfSample": TIMESTAMP,
+            "uncertaintyInMilliseconds": 0,
+        },
+    ]
+
+
+def state_report():
+    return {
+        "context": {"properties": _properties()},
+        "event": {
+            "header": _header("Alexa", "StateReport"),
+            "endpoint": _endpoint("endpoint-001"),
+            "payload": {},
+        },
+    }
+
+
+def change_report():
+    properties = _properties()
+    return {
+        "context": {"properties": properties[1:]},
+        "event": {
+            "header": _header("Alexa", "ChangeReport", False),
+            "endpoint": _endpoint("endpoint-001"),
+            "payload": {
+                "change": {
+                    "cause": {"type": "PHYSICAL_INTERACTION"},
+                    "properties": properties[:1],
+                },
+            },
+        },
+    }
+
+
+def _capability(interface, name=None):
+    capability = {
+        "type": "AlexaInterface",
+        "interface": interface,
+        "version": "3",
+    }
+    if name is not None:
+        capability["properties"] = {
+            "supported": [{"name": name}],
+            "proactivelyReported": True,
+            "retrievable": True,
+        }
+    return capability
+
+
+def discover_response(endpoints):
+    return {
+        "event": {
+            "header": _header("Alexa.Discovery", "Discover.Response", False),
+            "payload": {
+                "endpoints": [
+                    {
+                        "endpointId": "endpoint-%03d" % (index,),
+                        "manufacturerName": "Sample Manufacturer",
+                        "friendlyName": "Light %d" % (index,),
+                        "description": "Sample light %d" % (index,),
+                        "displayCategories": ["LIGHT"],
+                        "cookie": {"index": str(index)},
+                        "capabilities": [
+                            _capability("Alexa"),
+                            _capability("Alexa.PowerController", "powerState"),
+                            _capability(
+                                "Alexa.BrightnessController", "brightness",
+                            ),
+                            _capability(
+                                "Alexa.EndpointHealth", "connectivity",
+                            ),
+                        ],
+                    }
+                    for index in range(endpoints)
+                ],
+            },
+        },
+    }
+
+
+def payloads(seed=0):
+    """
+    The named instances to validate, generated the same way on every run.
+
+    """
+
+    random.seed(seed)
+    instances = [
+        ("StateReport", state_report()),
+        ("ChangeReport", change_report()),
+    ]
+    for endpoints in ENDPOINT_COUNTS:
+        name = "Discover.Response/%d" % (endpoints,)
+        instances.append((name, discover_response(endpoints)))
+    return instances
+
+
+def _refs(schema):
+    nodes = [schema]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if ref is not None:
+                yield ref
+            nodes.extend(node.values())
+        elif isinstance(node, list):
+            nodes.extend(node)
+
+
+def validators(schema):
+    """
+    Set up the response and endpoint validators the way the API does.
+
+    Returns:
+
+        the :class:`Draft4Validator` of responses, and a
+        :class:`CompiledValidator` of one Discover.Response endpoint
+
+    """
+
+    resolver = RefResolver.from_schema(schema)
+    for ref in set(_refs(schema)):
+        resolver.resolve(ref)
+    validator = Draft4Validator(
+        schema, resolver=resolver, discriminators=DISCRIMINATORS,
+    )
+
+    endpoint_validator = None
+    for branch in schema["oneOf"]:
+        if branch.get("description") == DISCOVER_RESPONSE:
+            event = branch["properties"]["event"]
+            payload = event["properties"]["payload"]
+            endpoint_validator = CompiledValidator(
+                Draft4Validator(
+                    payload["properties"]["endpoints"]["items"],
+                    resolver=resolver,
+                ),
+            )
+    return validator, endpoint_validator
+
+
+def check_response(compiled, endpoint_validator, instance):
+    """
+    Check a response the way the API does when validating responses.
+
+    Each Discover.Response endpoint is checked and marked as valid as it is
+    added, then the whole response is checked and the marks are cleared.
+
+    """
+
+    payload = instance["event"]["payload"]
+    for endpoint in payload.get("endpoints", ()):
+        if endpoint_validator.is_valid(endpoint):
+            compiled.validator.mark_valid(endpoint, endpoint_validator.schema)
+    try:
+        compiled.validate(instance)
+    finally:
+        compiled.validator.clear_marks()
+
+
+def _time(function, repeat):
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    times = [each / number for each in timer.repeat(repeat, number)]
+    return {
+        "loops": number,
+        "best": min(times),
+        "mean": sum(times) / len(times),
+        "times": times,
+    }
+
+
+def run(schema_path=SCHEMA_PATH, repeat=5, seed=0):
+    with open(schema_path) as file:
+        schema = json.load(file)
+
+    results = []
+
+    def record(name, payload, function):
+        result = _time(function, repeat)
+        result["benchmark"] = name
+        result["payload"] = payload
+        results.append(result)
+
+    record(
+        "check_schema", None, lambda: Draft4Validator.check_schema(schema),
+    )
+
+    validator, endpoint_validator = validators(schema)
+    compiled = CompiledValidator(validator)
+    for payload, instance in payloads(seed):
+        errors = list(validator.iter_errors(instance))
+        if errors:
+            raise ValueError(
+                "The generated %s is not valid: %s" % (
+                    payload, errors[0].message,
+                ),
+            )
+
+        record(
+            "iter_errors", payload,
+            lambda: list(validator.iter_errors(instance)),
+        )
+        record("is_valid", payload, lambda: validator.is_valid(instance))
+        record(
+            "compiled.is_valid", payload, lambda: compiled.is_valid(instance),
+        )
+        record(
+            "response", payload,
+            lambda: check_response(compiled, endpoint_validator, instance),
+        )
+
+    return {
+        "jsonschema": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "schema": os.path.basename(schema_path),
+        "repeat": repeat,
+        "seed": seed,
+        "unit": "seconds",
+        "results": results,
+    }
+
+
+parser = argparse.ArgumentParser(
+    description="Time validation of generated Alexa smart home messages",
+)
+parser.add_argument(
+    "--schema",
+    default=SCHEMA_PATH,
+    help="the path to alexa_smart_home_message_schema.json",
+)
+parser.add_argument(
+    "--repeat",
+    type=int,
+    default=5,
+    help="the number of timed runs of each benchmark",
+)
+parser.add_argument(
+    "--seed",
+    type=int,
+    default=0,
+    help="the seed of the generated payloads",
+)
+parser.add_argument(
+    "--output",
+    help="a path to write the JSON results to, instead of stdout",
+)
+
+
+def main(args=sys.argv[1:]):
+    arguments = parser.parse_args(args)
+    results = run(
+        schema_path=arguments.schema,
+        repeat=arguments.repeat,
+        seed=arguments.seed,
+    )
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
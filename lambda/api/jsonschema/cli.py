@@ -1,8 +1,12 @@
 from __future__ import absolute_import
 import argparse
 import json
+import multiprocessing
 import sys
+import time
+from collections import deque
 
+from jsonschema._compiler import CompiledValidator
 from jsonschema._reflect import namedAny
 from jsonschema.validators import validator_for
 
@@ -18,26 +22,81 @@ def _json_file(path):
         return json.load(file)
 
 
+class _InstanceFile(argparse.Action):
+    """
+    Load a JSON instance, keeping its path as the source of its errors.
+
+    """
+
+    def __call__(self, parser, namespace, path, option_string=None):
+        try:
+            instance = _json_file(path)
+        except ValueError:
+            parser.error(
+                "argument %s: invalid JSON instance: %r" % (
+                    "/".join(self.option_strings), path,
+                ),
+            )
+        for dest, value in (
+            ("instances", instance), ("instance_sources", path),
+        ):
+            values = getattr(namespace, dest, None) or []
+            setattr(namespace, dest, values + [value])
+
+
 parser = argparse.ArgumentParser(
     description="JSON Schema Validation CLI",
 )
 parser.add_argument(
     "-i", "--instance",
-    action="append",
+    action=_InstanceFile,
     dest="instances",
-    type=_json_file,
     help=(
         "a path to a JSON instance (i.e. filename.json)"
         "to validate (may be specified multiple times)"
     ),
 )
+parser.add_argument(
+    "-b", "--batch-instance",
+    action="append",
+    dest="batch",
+    metavar="PATH",
+    help=(
+        "a path to a JSON instance that is only read when it is validated, "
+        "for checking many files (may be specified multiple times)"
+    ),
+)
+parser.add_argument(
+    "--ndjson",
+    action="append",
+    metavar="PATH",
+    help=(
+        "a path to a file with one JSON instance per line, or - for stdin "
+        "(may be specified multiple times)"
+    ),
+)
+parser.add_argument(
+    "-j", "--jobs",
+    type=int,
+    default=1,
+    help=(
+        "the number of processes validating batch and ndjson instances"
+    ),
+)
+parser.add_argument(
+    "--chunk-size",
+    type=int,
+    default=64,
+    help="the number of batch or ndjson instances sent to a process at once",
+)
 parser.add_argument(
     "-F", "--error-format",
     default="{error.instance}: {error.message}\n",
     help=(
         "the format to use for each error output message, specified in "
         "a form suitable for passing to str.format, which will be called "
-        "with 'error' for each error"
+        "with 'error' for each error and 'source' for the path of its "
+        "instance"
     ),
 )
 parser.add_argument(
@@ -67,15 +126,168 @@ def main(args=sys.argv[1:]):
     sys.exit(run(arguments=parse_args(args=args)))
 
 
-def run(arguments, stdout=sys.stdout, stderr=sys.stderr):
+def run(arguments, stdout=sys.stdout, stderr=sys.stderr, stdin=sys.stdin):
     error_format = arguments["error_format"]
     validator = arguments["validator"](schema=arguments["schema"])
 
     validator.check_schema(arguments["schema"])
 
     errored = False
-    for instance in arguments["instances"] or ():
+    instances = arguments["instances"] or ()
+    sources = arguments.get("instance_sources") or (
+        [u"<instance>"] * len(instances)
+    )
+    for source, instance in zip(sources, instances):
         for error in validator.iter_errors(instance):
-            stderr.write(error_format.format(error=error))
+            stderr.write(error_format.format(error=error, source=source))
+            errored = True
+
+    if arguments.get("batch") or arguments.get("ndjson"):
+        if _run_batch(arguments, stdout, stderr, stdin):
             errored = True
     return errored
+
+
+# The validator and error format of a batch worker, set by _start_worker
+_worker = None
+
+
+def _start_worker(validator, schema, error_format):
+    global _worker
+    validator = validator(schema=schema)
+    if hasattr(validator, "VALIDATORS"):
+        # Most instances are valid, so check them with the compiled schema
+        # and only walk the schema for errors when one is not
+        is_valid = CompiledValidator(validator).is_valid
+    else:
+        is_valid = getattr(validator, "is_valid", None)
+    _worker = validator, is_valid, error_format
+
+
+def _check_batch(batch):
+    """
+    Validate a list of ``(source, line)`` pairs in a worker.
+
+    ``line`` is the text of an ndjson instance, or ``None`` to read the
+    instance from the file at ``source``. Returns a list of ``(source,
+    messages, readable)`` with the formatted errors of each instance.
+
+    """
+
+    validator, is_valid, error_format = _worker
+
+    results = []
+    for source, line in batch:
+        try:
+            if line is None:
+                instance = _json_file(source)
+            else:
+                instance = json.loads(line)
+        except (IOError, OSError, ValueError) as error:
+            results.append((source, ["%s: %s\n" % (source, error)], False))
+            continue
+
+        if is_valid is not None and is_valid(instance):
+            results.append((source, [], True))
+            continue
+        messages = [
+            error_format.format(error=error, source=source)
+            for error in validator.iter_errors(instance)
+        ]
+        results.append((source, messages, True))
+    return results
+
+
+def _batch_instances(arguments, stdin):
+    for path in arguments.get("batch") or ():
+        yield path, None
+
+    for path in arguments.get("ndjson") or ():
+        if path == "-":
+            file, name = stdin, "<stdin>"
+        else:
+            file, name = open(path), path
+        try:
+            for number, line in enumerate(file, 1):
+                if line.strip():
+                    yield "%s:%d" % (name, number), line
+        finally:
+            if file is not stdin:
+                file.close()
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for each in iterable:
+        chunk.append(each)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _run_batch(arguments, stdout, stderr, stdin):
+    """
+    Validate the batch and ndjson instances, writing errors as they are found.
+
+    Instances are read lazily and validated in chunks, across a process pool
+    when more than one job is asked for, and a summary is written at the end.
+
+    """
+
+    jobs = max(arguments.get("jobs") or 1, 1)
+    chunks = _chunks(
+        _batch_instances(arguments, stdin),
+        max(arguments.get("chunk_size") or 64, 1),
+    )
+    worker = (
+        arguments["validator"], arguments["schema"], arguments["error_format"],
+    )
+    counts = {"instances": 0, "invalid": 0, "errors": 0, "unreadable": 0}
+    start = time.time()
+
+    def report(results):
+        for source, messages, readable in results:
+            counts["instances"] += 1
+            if not readable:
+                counts["unreadable"] += 1
+            elif messages:
+                counts["invalid"] += 1
+                counts["errors"] += len(messages)
+            for message in messages:
+                stderr.write(message)
+
+    if jobs == 1:
+        _start_worker(*worker)
+        for chunk in chunks:
+            report(_check_batch(chunk))
+    else:
+        pool = multiprocessing.Pool(jobs, _start_worker, worker)
+        try:
+            # Only a few chunks are in flight, so input is read as it is used
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_check_batch, (chunk,)))
+                if len(pending) >= jobs * 2:
+                    report(pending.popleft().get())
+            while pending:
+                report(pending.popleft().get())
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    seconds = time.time() - start
+    stdout.write(
+        "%d instances, %d invalid, %d errors, %d unreadable "
+        "in %.2f seconds (%.0f instances/second)\n" % (
+            counts["instances"],
+            counts["invalid"],
+            counts["errors"],
+            counts["unreadable"],
+            seconds,
+            counts["instances"] / seconds if seconds else 0,
+        )
+    )
+    return counts["invalid"] > 0 or counts["unreadable"] > 0
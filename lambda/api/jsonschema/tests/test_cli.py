@@ -1,3 +1,8 @@
+import json
+import os
+import shutil
+import tempfile
+
 from jsonschema import Draft4Validator, ValidationError, cli
 from jsonschema.compat import StringIO
 from jsonschema.exceptions import SchemaError
@@ -133,3 +138,124 @@ class TestCLI(unittest.TestCase):
         self.assertFalse(stdout.getvalue())
         self.assertEqual(stderr.getvalue(), "1 - 9\t1 - 8\t2 - 7\t")
         self.assertEqual(exit_code, 1)
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def instance_file(self, name, instance):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as file:
+            json.dump(instance, file)
+        return path
+
+    def run_batch(self, stdin=u"", **arguments):
+        stdout, stderr = StringIO(), StringIO()
+        arguments.setdefault("instances", None)
+        arguments.setdefault("error_format", "{source} - {error.message}\n")
+        exit_code = cli.run(
+            dict(
+                validator=Draft4Validator,
+                schema={"type": "integer"},
+                **arguments
+            ),
+            stdout=stdout,
+            stderr=stderr,
+            stdin=StringIO(stdin),
+        )
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+    def test_ndjson_from_stdin(self):
+        exit_code, stdout, stderr = self.run_batch(
+            stdin=u"1\n\n\"a\"\n2\n",
+            ndjson=["-"],
+        )
+        self.assertEqual(
+            stderr, "<stdin>:3 - 'a' is not of type 'integer'\n",
+        )
+        self.assertTrue(stdout.startswith(
+            "3 instances, 1 invalid, 1 errors, 0 unreadable in ",
+        ))
+        self.assertEqual(exit_code, True)
+
+    def test_instance_files(self):
+        valid = self.instance_file("valid.json", 12)
+        invalid = self.instance_file("invalid.json", 1.5)
+        exit_code, stdout, stderr = self.run_batch(batch=[valid, invalid])
+        self.assertEqual(stderr, "%s - 1.5 is not of type 'integer'\n" % (
+            invalid,
+        ))
+        self.assertTrue(stdout.startswith("2 instances, 1 invalid"))
+        self.assertEqual(exit_code, True)
+
+    def test_unreadable_instances(self):
+        missing = os.path.join(self.directory, "missing.json")
+        path = os.path.join(self.directory, "lines.ndjson")
+        with open(path, "w") as file:
+            file.write("1\n{nope\n")
+        exit_code, stdout, stderr = self.run_batch(
+            batch=[missing], ndjson=[path],
+        )
+        self.assertIn(missing, stderr)
+        self.assertIn(path + ":2", stderr)
+        self.assertTrue(stdout.startswith(
+            "3 instances, 0 invalid, 0 errors, 2 unreadable",
+        ))
+        self.assertEqual(exit_code, True)
+
+    def test_successful_batch(self):
+        exit_code, stdout, stderr = self.run_batch(
+            stdin=u"1\n2\n", ndjson=["-"],
+        )
+        self.assertEqual(stderr, "")
+        self.assertEqual(exit_code, False)
+
+    def test_process_pool(self):
+        lines = u"".join(u"%s\n" % (json.dumps(n),) for n in range(20))
+        lines += u"\"x\"\n"
+        exit_code, stdout, stderr = self.run_batch(
+            stdin=lines, ndjson=["-"], jobs=2, chunk_size=3,
+        )
+        self.assertEqual(
+            stderr, "<stdin>:21 - 'x' is not of type 'integer'\n",
+        )
+        self.assertTrue(stdout.startswith("21 instances, 1 invalid"))
+        self.assertEqual(exit_code, True)
+
+    def test_parse_batch_arguments(self):
+        schema = self.instance_file("schema.json", {})
+        arguments = cli.parse_args(
+            [
+                "-b", "a.json", "-b", "b.json", "--ndjson", "-",
+                "-j", "4", schema,
+            ]
+        )
+        self.assertEqual(arguments["batch"], ["a.json", "b.json"])
+        self.assertEqual(arguments["ndjson"], ["-"])
+        self.assertEqual(arguments["jobs"], 4)
+        self.assertEqual(arguments["chunk_size"], 64)
+
+    def test_instance_source(self):
+        instance = self.instance_file("instance.json", 1.5)
+        schema = self.instance_file("schema.json", {"type": "integer"})
+        arguments = cli.parse_args(
+            ["-i", instance, "-F", "{source} - {error.message}\n", schema],
+        )
+        self.assertEqual(arguments["instances"], [1.5])
+        self.assertEqual(arguments["instance_sources"], [instance])
+
+        stdout, stderr = StringIO(), StringIO()
+        self.assertTrue(cli.run(arguments, stdout=stdout, stderr=stderr))
+        self.assertEqual(
+            stderr.getvalue(), "%s - 1.5 is not of type 'integer'\n" % (
+                instance,
+            ),
+        )
+
+    def test_instance_source_without_a_path(self):
+        exit_code, stdout, stderr = self.run_batch(instances=[1.5])
+        self.assertEqual(
+            stderr, "<instance> - 1.5 is not of type 'integer'\n",
+        )
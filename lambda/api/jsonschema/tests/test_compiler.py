@@ -0,0 +1,259 @@
+from jsonschema import (
+    CompiledValidator, FormatChecker, RefResolver, ValidationError,
+)
+from jsonschema.tests.compat import unittest
+from jsonschema.validators import (
+    RefResolutionError, UnknownType, Draft3Validator, Draft4Validator, extend,
+)
+
+
+class TestCompiledValidator(unittest.TestCase):
+    def assertAgrees(self, schema, instances, Validator=Draft4Validator, **kw):
+        validator = Validator(schema, **kw)
+        compiled = CompiledValidator(validator)
+        for instance in instances:
+            self.assertEqual(
+                compiled.is_valid(instance),
+                validator.is_valid(instance),
+                "%r under %r" % (instance, schema),
+            )
+
+    def test_type(self):
+        self.assertAgrees(
+            {u"type": [u"integer", u"null"]},
+            [1, 1.5, None, True, u"1", [], {}],
+        )
+        self.assertAgrees({u"type": u"number"}, [1, 1.5, True, False, u"1"])
+        self.assertAgrees({u"type": u"boolean"}, [True, 0, None])
+
+    def test_unknown_type(self):
+        compiled = CompiledValidator(Draft4Validator({u"type": u"foo"}))
+        with self.assertRaises(UnknownType):
+            compiled.is_valid(12)
+
+    def test_numbers(self):
+        self.assertAgrees(
+            {u"minimum": 2, u"maximum": 5, u"exclusiveMaximum": True},
+            [1, 2, 4.9, 5, 6, True, u"x"],
+        )
+        self.assertAgrees({u"multipleOf": 3}, [0, 3, 4, 9.0, True])
+        self.assertAgrees({u"multipleOf": 0.01}, [0.07, 0.075, 19.99])
+
+    def test_strings(self):
+        self.assertAgrees(
+            {u"minLength": 2, u"maxLength": 3, u"pattern": u"^a"},
+            [u"", u"a", u"ab", u"abcd", u"ba", 12],
+        )
+
+    def test_format(self):
+        schema = {u"format": u"ipv4"}
+        self.assertAgrees(schema, [u"1.1.1.1", u"foo", 12])
+        self.assertAgrees(
+            schema, [u"1.1.1.1", u"foo", 12], format_checker=FormatChecker(),
+        )
+
+    def test_enum(self):
+        self.assertAgrees(
+            {u"enum": [1, u"a", {u"b": [2]}]},
+            [1, True, u"a", {u"b": [2]}, {u"b": []}, None],
+        )
+
+    def test_objects(self):
+        schema = {
+            u"properties": {u"a": {u"type": u"string"}, u"b": {}},
+            u"patternProperties": {u"^x": {u"type": u"integer"}},
+            u"additionalProperties": False,
+            u"required": [u"a"],
+            u"minProperties": 1,
+            u"maxProperties": 3,
+        }
+        self.assertAgrees(
+            schema,
+            [
+                {u"a": u"1"},
+                {u"a": 1},
+                {u"b": 1},
+                {u"a": u"1", u"x1": 1},
+                {u"a": u"1", u"x1": u"1"},
+                {u"a": u"1", u"c": 1},
+                {u"a": u"1", u"b": 1, u"x1": 1, u"x2": 2},
+                [u"a"],
+            ],
+        )
+        self.assertAgrees(
+            {u"additionalProperties": {u"type": u"integer"}},
+            [{u"a": 1}, {u"a": u"1"}, {}],
+        )
+
+    def test_dependencies(self):
+        self.assertAgrees(
+            {
+                u"dependencies": {
+                    u"a": [u"b"],
+                    u"c": {u"required": [u"d"]},
+                    u"e": u"f",
+                },
+            },
+            [{}, {u"a": 1}, {u"a": 1, u"b": 1}, {u"c": 1}, {u"e": 1}, 12],
+        )
+
+    def test_arrays(self):
+        self.assertAgrees(
+            {u"items": {u"type": u"integer"}, u"minItems": 1, u"maxItems": 2},
+            [[], [1], [1, 2], [1, 2, 3], [u"1"], u"12"],
+        )
+        self.assertAgrees(
+            {
+                u"items": [{u"type": u"integer"}, {}],
+                u"additionalItems": False,
+            },
+            [[], [1], [u"1"], [1, u"2"], [1, 2, 3]],
+        )
+        self.assertAgrees(
+            {u"items": [{}], u"additionalItems": {u"type": u"string"}},
+            [[1], [1, u"2"], [1, 2]],
+        )
+        self.assertAgrees(
+            {u"uniqueItems": True},
+            [[1, 2], [1, 1], [1, True], [{u"a": 1}, {u"a": 1}], [[1], [1]]],
+        )
+
+    def test_combinators(self):
+        integer, positive = {u"type": u"integer"}, {u"minimum": 0}
+        instances = [-1, 1, 1.5, -1.5, u"1"]
+        self.assertAgrees({u"allOf": [integer, positive]}, instances)
+        self.assertAgrees({u"anyOf": [integer, positive]}, instances)
+        self.assertAgrees({u"oneOf": [integer, positive]}, instances)
+        self.assertAgrees({u"oneOf": [{}, {}]}, instances)
+        self.assertAgrees({u"not": integer}, instances)
+        self.assertAgrees({u"not": {}}, instances)
+
+    def test_discriminators(self):
+        schema = {
+            u"oneOf": [
+                {u"properties": {u"name": {u"enum": [u"a"]}}},
+                {
+                    u"properties": {u"name": {u"enum": [u"a", u"b"]}},
+                    u"required": [u"x"],
+                },
+                {u"required": [u"y"]},
+            ],
+        }
+        instances = [
+            {u"name": u"a"},
+            {u"name": u"a", u"x": 1},
+            {u"name": u"b"},
+            {u"name": u"b", u"x": 1},
+            {u"name": u"c", u"y": 1},
+            {u"y": 1},
+        ]
+        self.assertAgrees(schema, instances, discriminators=[(u"name",)])
+        self.assertAgrees(
+            {u"anyOf": schema[u"oneOf"]},
+            instances,
+            discriminators=[(u"name",)],
+        )
+
+    def test_marked_items(self):
+        schema = {u"items": {u"required": [u"id"]}}
+        validator = Draft4Validator(schema)
+        compiled = CompiledValidator(validator)
+        invalid = {}
+        self.assertFalse(compiled.is_valid([invalid]))
+        validator.mark_valid(invalid, schema[u"items"])
+        self.assertTrue(compiled.is_valid([invalid]))
+        validator.clear_marks()
+        self.assertFalse(compiled.is_valid([invalid]))
+
+    def test_recursive_ref(self):
+        schema = {
+            u"definitions": {
+                u"node": {
+                    u"type": u"object",
+                    u"properties": {
+                        u"children": {
+                            u"type": u"array",
+                            u"items": {u"$ref": u"#/definitions/node"},
+                        },
+                    },
+                    u"required": [u"children"],
+                },
+            },
+            u"$ref": u"#/definitions/node",
+        }
+        self.assertAgrees(
+            schema,
+            [
+                {u"children": []},
+                {u"children": [{u"children": []}]},
+                {u"children": [{u"children": [{}]}]},
+                {},
+            ],
+        )
+
+    def test_ref_in_scope(self):
+        schema = {
+            u"id": u"http://example.com/root.json",
+            u"properties": {
+                u"a": {
+                    u"id": u"nested/",
+                    u"properties": {u"b": {u"$ref": u"#/definitions/c"}},
+                    u"definitions": {u"c": {u"type": u"integer"}},
+                },
+            },
+        }
+        resolver_schema = dict(schema[u"properties"][u"a"])
+        store = {u"http://example.com/nested/": resolver_schema}
+        resolver = RefResolver.from_schema(schema, store=store)
+        validator = Draft4Validator(schema, resolver=resolver)
+        compiled = CompiledValidator(validator)
+        for instance in [{u"a": {u"b": 1}}, {u"a": {u"b": u"1"}}]:
+            self.assertEqual(
+                compiled.is_valid(instance), validator.is_valid(instance),
+            )
+
+    def test_unresolvable_ref_raises_when_used(self):
+        compiled = CompiledValidator(
+            Draft4Validator(
+                {u"properties": {u"a": {u"$ref": u"#/definitions/missing"}}},
+            ),
+        )
+        self.assertTrue(compiled.is_valid({}))
+        with self.assertRaises(RefResolutionError):
+            compiled.is_valid({u"a": 1})
+
+    def test_extended_keyword(self):
+        def even(validator, value, instance, schema):
+            if value and instance % 2:
+                yield ValidationError("%r is odd" % (instance,))
+
+        Validator = extend(Draft4Validator, {u"even": even})
+        self.assertAgrees(
+            {u"type": u"integer", u"even": True}, [1, 2], Validator=Validator,
+        )
+
+    def test_draft3(self):
+        self.assertAgrees(
+            {
+                u"properties": {u"a": {u"required": True}},
+                u"type": [u"integer", {u"type": u"object"}],
+            },
+            [1, {}, {u"a": 1}, u"1"],
+            Validator=Draft3Validator,
+        )
+
+    def test_errors_match_the_validator(self):
+        schema = {u"properties": {u"a": {u"type": u"string"}}}
+        validator = Draft4Validator(schema)
+        compiled = CompiledValidator(validator)
+
+        self.assertEqual(list(compiled.iter_errors({u"a": u"1"})), [])
+        instance = {u"a": 1}
+        self.assertEqual(
+            [error.message for error in compiled.iter_errors(instance)],
+            [error.message for error in validator.iter_errors(instance)],
+        )
+        with self.assertRaises(ValidationError) as e:
+            compiled.validate(instance)
+        self.assertEqual(list(e.exception.path), [u"a"])
+        compiled.validate({u"a": u"1"})
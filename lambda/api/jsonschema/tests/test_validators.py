@@ -1,8 +1,9 @@
 from collections import deque
 from contextlib import contextmanager
 import json
+import re
 
-from jsonschema import FormatChecker, ValidationError
+from jsonschema import FormatChecker, ValidationError, _utils
 from jsonschema.tests.compat import mock, unittest
 from jsonschema.validators import (
     RefResolutionError, UnknownType, Draft3Validator,
@@ -691,6 +692,23 @@ class ValidatorTestMixin(object):
         with self.assertRaises(UnknownType):
             self.validator.is_type("foo", object())
 
+    def test_is_type_with_custom_types(self):
+        validator = self.validator_class(
+            {}, types={"number": (int, float, bool), "tuple": tuple},
+        )
+        self.assertTrue(validator.is_type(True, "number"))
+        self.assertFalse(validator.is_type(True, "integer"))
+        self.assertTrue(validator.is_type((1,), "tuple"))
+        self.assertFalse(validator.is_type([1], "tuple"))
+
+    def test_is_type_with_types_json_does_not_decode_to(self):
+        from collections import OrderedDict
+        from decimal import Decimal
+
+        self.assertTrue(self.validator.is_type(OrderedDict(), "object"))
+        self.assertTrue(self.validator.is_type(Decimal("1.5"), "number"))
+        self.assertFalse(self.validator.is_type(Decimal("1.5"), "integer"))
+
 
 class TestDraft3Validator(ValidatorTestMixin, unittest.TestCase):
     validator_class = Draft3Validator
@@ -711,6 +729,86 @@ class TestDraft3Validator(ValidatorTestMixin, unittest.TestCase):
 class TestDraft4Validator(ValidatorTestMixin, unittest.TestCase):
     validator_class = Draft4Validator
 
+    def test_unique_objects_and_arrays(self):
+        validator = self.validator_class({u"uniqueItems": True})
+        self.assertTrue(validator.is_valid([{u"a": [1]}, {u"a": [2]}]))
+        self.assertFalse(validator.is_valid([{u"a": [1]}, {u"a": [1.0]}]))
+        self.assertFalse(validator.is_valid([{u"a": 1}, {u"a": True}]))
+        self.assertTrue(validator.is_valid([{}, [], 1, True]))
+        self.assertFalse(validator.is_valid([[{u"a": 1}], [{u"a": 1}]]))
+
+
+class TestPatternCache(unittest.TestCase):
+    def setUp(self):
+        _utils.compile_pattern.cache_clear()
+        self.addCleanup(_utils.compile_pattern.cache_clear)
+
+    def test_patterns_are_compiled_once(self):
+        schema = {
+            u"properties": {u"a": {u"pattern": u"^a+$"}},
+            u"patternProperties": {u"^x": {}, u"^y": {}},
+            u"additionalProperties": False,
+        }
+        validator = Draft4Validator(schema)
+        self.assertEqual(_utils.compile_pattern.cache_info().currsize, 0)
+
+        self.assertTrue(validator.is_valid({u"a": u"aa", u"x1": 1}))
+        self.assertFalse(validator.is_valid({u"a": u"b"}))
+        self.assertFalse(validator.is_valid({u"z": 1}))
+        info = _utils.compile_pattern.cache_info()
+        self.assertEqual((info.misses, info.currsize), (4, 4))
+
+    def test_invalid_patterns_fail_when_used(self):
+        validator = Draft4Validator({u"pattern": u"("})
+        self.assertTrue(validator.is_valid(12))
+        with self.assertRaises(re.error):
+            validator.is_valid(u"a")
+
+    def test_regex_format_uses_the_cache(self):
+        checker = FormatChecker()
+        self.assertTrue(checker.conforms(u"^a", u"regex"))
+        self.assertTrue(checker.conforms(u"^a", u"regex"))
+        self.assertFalse(checker.conforms(u"(", u"regex"))
+        self.assertEqual(_utils.compile_pattern.cache_info().hits, 1)
+
+
+class TestMarkValid(unittest.TestCase):
+    def setUp(self):
+        self.schema = {
+            u"type": u"array",
+            u"items": {u"type": u"object", u"required": [u"id"]},
+        }
+        self.validator = Draft4Validator(self.schema)
+        self.item = {u"id": 1}
+
+    def test_marked_instances_are_skipped(self):
+        invalid, items = {}, self.schema[u"items"]
+        self.validator.mark_valid(invalid, items)
+        self.assertTrue(self.validator.is_valid(invalid, items))
+        self.assertEqual(list(self.validator.iter_errors(invalid, items)), [])
+
+    def test_marks_only_apply_to_the_same_objects(self):
+        self.validator.mark_valid({}, self.schema[u"items"])
+        self.assertFalse(self.validator.is_valid([{}]))
+        self.validator.mark_valid(self.item, {u"required": [u"id"]})
+        self.assertFalse(self.validator.is_valid([{}, self.item]))
+
+    def test_marked_parts_of_a_larger_instance(self):
+        invalid = {}
+        self.validator.mark_valid(invalid, self.schema[u"items"])
+        self.assertTrue(self.validator.is_valid([self.item, invalid]))
+        self.validator.validate([self.item, invalid])
+        self.validator.clear_marks()
+        self.assertFalse(self.validator.is_valid([self.item, invalid]))
+
+    def test_oldest_marks_are_forgotten(self):
+        self.validator.MAX_MARKED = 2
+        items = [{}, {}, {}]
+        for item in items:
+            self.validator.mark_valid(item, self.schema[u"items"])
+        self.assertFalse(self.validator.is_valid([items[0]]))
+        self.assertTrue(self.validator.is_valid(items[1:]))
+
 
 class TestBuiltinFormats(unittest.TestCase):
     """
@@ -783,6 +881,98 @@ class TestValidate(unittest.TestCase):
             chk_schema.assert_called_once_with({})
 
 
+class TestDiscriminators(unittest.TestCase):
+    schema = {
+        u"definitions": {
+            u"named": {
+                u"properties": {u"name": {u"enum": [u"b", u"c"]}},
+            },
+        },
+        u"oneOf": [
+            {
+                u"properties": {
+                    u"name": {u"enum": [u"a"]}, u"size": {u"type": u"integer"},
+                },
+            },
+            {u"$ref": u"#/definitions/named"},
+            {
+                u"allOf": [
+                    {u"$ref": u"#/definitions/named"}, {u"required": [u"x"]},
+                ],
+            },
+            {u"required": [u"y"]},
+        ],
+    }
+
+    def setUp(self):
+        self.validator = Draft4Validator(
+            self.schema, discriminators=[(u"name",)],
+        )
+
+    def test_discriminate(self):
+        discriminate = self.validator.discriminate
+        oneOf = self.schema[u"oneOf"]
+        self.assertEqual(discriminate({u"name": u"a"}, oneOf), [0, 3])
+        self.assertEqual(discriminate({u"name": u"b"}, oneOf), [1, 2, 3])
+        self.assertEqual(discriminate({u"name": u"d"}, oneOf), [3])
+        self.assertIsNone(discriminate({}, oneOf))
+        self.assertIsNone(discriminate({u"name": []}, oneOf))
+        self.assertIsNone(discriminate(12, oneOf))
+
+    def test_without_discriminators(self):
+        validator = Draft4Validator(self.schema)
+        self.assertIsNone(
+            validator.discriminate({u"name": u"a"}, self.schema[u"oneOf"]),
+        )
+
+    def test_only_candidates_are_validated(self):
+        with mock.patch.object(
+            self.validator, "is_valid", wraps=self.validator.is_valid,
+        ) as is_valid:
+            self.assertEqual(
+                list(self.validator.iter_errors({u"name": u"a"})), [],
+            )
+        self.assertEqual(
+            [call[0][1] for call in is_valid.call_args_list],
+            [self.schema[u"oneOf"][0], self.schema[u"oneOf"][3]],
+        )
+
+    def test_results_match_exhaustive_checking(self):
+        validator = Draft4Validator(self.schema)
+        instances = [
+            {u"name": u"a"},
+            {u"name": u"a", u"size": u"1"},
+            {u"name": u"a", u"y": 1},
+            {u"name": u"b"},
+            {u"name": u"b", u"x": 1},
+            {u"name": u"d"},
+            {u"name": u"d", u"y": 1},
+            {u"name": {}},
+            {},
+        ]
+        for instance in instances:
+            self.assertEqual(
+                [e.message for e in self.validator.iter_errors(instance)],
+                [e.message for e in validator.iter_errors(instance)],
+            )
+
+    def test_anyOf(self):
+        schema = {u"anyOf": self.schema[u"oneOf"][:2]}
+        schema[u"definitions"] = self.schema[u"definitions"]
+        validator = Draft4Validator(schema, discriminators=[(u"name",)])
+        self.assertTrue(validator.is_valid({u"name": u"a"}))
+        self.assertTrue(validator.is_valid({u"name": u"b"}))
+        self.assertFalse(validator.is_valid({u"name": u"d"}))
+        self.assertTrue(validator.is_valid({}))
+
+    def test_recursive_ref(self):
+        schema = {u"oneOf": [{u"$ref": u"#"}, {u"required": [u"y"]}]}
+        validator = Draft4Validator(schema, discriminators=[(u"name",)])
+        self.assertIsNone(
+            validator.discriminate({u"name": u"a"}, schema[u"oneOf"]),
+        )
+
+
 class TestRefResolver(unittest.TestCase):
 
     base_uri = ""
@@ -900,6 +1090,39 @@ class TestRefResolver(unittest.TestCase):
             pass
         self.assertEqual(foo_handler.call_count, 1)
 
+    def test_local_refs_are_cached(self):
+        resolver = RefResolver("", {"a": {"b": 12}})
+        for _ in range(3):
+            with resolver.resolving("#/a/b") as resolved:
+                self.assertEqual(resolved, 12)
+        info = resolver.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 1))
+
+    def test_changing_the_store_clears_the_cache(self):
+        ref = self.stored_uri + "#/stored"
+        self.assertEqual(self.resolver.resolve(ref)[1], "schema")
+        self.resolver.store[self.stored_uri] = {"stored": "changed"}
+        self.assertEqual(self.resolver.resolve(ref)[1], "changed")
+        del self.resolver.store[self.stored_uri]
+        with self.assertRaises(RefResolutionError):
+            self.resolver.resolve(ref)
+
+    def test_caching_a_remote_document_keeps_the_cache(self):
+        foo_handler = mock.Mock(return_value={"baz": 1})
+        resolver = RefResolver(
+            "", {"a": 12}, cache_remote=True, handlers={"foo": foo_handler},
+        )
+        self.assertEqual(resolver.resolve("#/a")[1], 12)
+        self.assertEqual(resolver.resolve("foo://bar#/baz")[1], 1)
+        self.assertEqual(resolver.resolve("#/a")[1], 12)
+        info = resolver.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 2))
+
+    def test_cache_info_without_a_cache(self):
+        resolver = RefResolver("", {}, remote_cache=lambda url: {})
+        self.assertIsNone(resolver.cache_info())
+        resolver.clear_cache()
+
     def test_if_you_give_it_junk_you_get_a_resolution_error(self):
         ref = "foo://bar"
         foo_handler = mock.Mock(side_effect=ValueError("Oh no! What's this?"))
@@ -2,6 +2,7 @@ from __future__ import division
 
 import contextlib
 import json
+from collections import OrderedDict
 import numbers
 
 try:
@@ -63,12 +64,15 @@ def create(meta_schema, validators=(), version=None, default_types=None):  # noq
         VALIDATORS = dict(validators)
         META_SCHEMA = dict(meta_schema)
         DEFAULT_TYPES = dict(default_types)
+        MAX_MARKED = 1024
 
         def __init__(
             self, schema, types=(), resolver=None, format_checker=None,
+            discriminators=(),
         ):
             self._types = dict(self.DEFAULT_TYPES)
             self._types.update(types)
+            self._type_checkers = {}
 
             if resolver is None:
                 resolver = RefResolver.from_schema(schema)
@@ -76,6 +80,9 @@ def create(meta_schema, validators=(), version=None, default_types=None):  # noq
             self.resolver = resolver
             self.format_checker = format_checker
             self.schema = schema
+            self.discriminators = [tuple(path) for path in discriminators]
+            self._discriminator_tables = {}
+            self._marked = OrderedDict()
 
         @classmethod
         def check_schema(cls, schema):
@@ -85,6 +92,8 @@ def create(meta_schema, validators=(), version=None, default_types=None):  # noq
         def iter_errors(self, instance, _schema=None):
             if _schema is None:
                 _schema = self.schema
+            if self._marked and (id(instance), id(_schema)) in self._marked:
+                return
 
             scope = _schema.get(u"id")
             if scope:
@@ -130,27 +139,149 @@ def create(meta_schema, validators=(), version=None, default_types=None):  # noq
                 raise error
 
         def is_type(self, instance, type):
-            if type not in self._types:
-                raise UnknownType(type, instance, self.schema)
-            pytypes = self._types[type]
-
-            # bool inherits from int, so ensure bools aren't reported as ints
-            if isinstance(instance, bool):
-                pytypes = _utils.flatten(pytypes)
-                is_number = any(
-                    issubclass(pytype, numbers.Number) for pytype in pytypes
-                )
-                if is_number and bool not in pytypes:
-                    return False
-            return isinstance(instance, pytypes)
+            check = self._type_checkers.get(type)
+            if check is None:
+                if type not in self._types:
+                    raise UnknownType(type, instance, self.schema)
+                check = _utils.type_checker(self._types[type])
+                self._type_checkers[type] = check
+            return check(instance)
 
         def is_valid(self, instance, _schema=None):
             error = next(self.iter_errors(instance, _schema), None)
             return error is None
 
+        def mark_valid(self, instance, _schema=None):
+            """
+            Remember that ``instance`` is valid under ``_schema``.
+
+            Later checks of the same instance object under the same schema
+            object, including as part of a larger instance, skip it. This
+            lets the parts of a large instance be checked as they are built.
+            The instance must not be changed once it is marked.
+
+            At most :attr:`MAX_MARKED` instances are remembered, the oldest
+            are forgotten first.
+
+            """
+
+            if _schema is None:
+                _schema = self.schema
+            key = id(instance), id(_schema)
+            # Keep references so the ids are not reused while marked
+            self._marked.pop(key, None)
+            self._marked[key] = instance, _schema
+            while len(self._marked) > self.MAX_MARKED:
+                self._marked.popitem(last=False)
+
+        def clear_marks(self):
+            self._marked.clear()
+
+        def discriminate(self, instance, subschemas):
+            """
+            Find the ``oneOf`` or ``anyOf`` branches an instance can match.
+
+            Each discriminator is a path of property names, ex:
+            ``("event", "header", "name")``. A branch whose ``enum`` at that
+            path does not contain the instance's value there cannot be valid.
+
+            Returns:
+
+                list: the indices of the remaining branches, or ``None`` if
+                no discriminator applies to the instance
+
+            """
+
+            if not self.discriminators:
+                return None
+            return _utils.discriminate(
+                instance, self.discriminator_table(subschemas),
+            )
+
+        def discriminator_table(self, subschemas):
+            key = id(subschemas), self.resolver.resolution_scope
+            cached = self._discriminator_tables.get(key)
+            if cached is not None and cached[0] is subschemas:
+                return cached[1]
+
+            table = []
+            for path in self.discriminators:
+                values = [
+                    self._discriminator_values(subschema, path, ())
+                    for subschema in subschemas
+                ]
+                if any(allowed is not None for allowed in values):
+                    table.append((path, values))
+            self._discriminator_tables[key] = subschemas, table
+            return table
+
+        def _discriminator_values(self, schema, path, seen):
+            """
+            The values a schema allows at ``path``, or ``None`` for any value.
+
+            """
+
+            if not isinstance(schema, dict) or id(schema) in seen:
+                return None
+            seen += (id(schema),)
+
+            ref = schema.get(u"$ref")
+            if ref is not None and u"$ref" in self.VALIDATORS:
+                try:
+                    with self.resolver.resolving(ref) as resolved:
+                        return self._discriminator_values(resolved, path, seen)
+                except RefResolutionError:
+                    return None
+
+            scope = schema.get(u"id")
+            if scope:
+                self.resolver.push_scope(scope)
+            try:
+                allowed = None
+                if path:
+                    properties = schema.get(u"properties")
+                    if (
+                        u"properties" in self.VALIDATORS and
+                        isinstance(properties, dict) and
+                        path[0] in properties
+                    ):
+                        allowed = self._discriminator_values(
+                            properties[path[0]], path[1:], seen,
+                        )
+                elif u"enum" in schema and u"enum" in self.VALIDATORS:
+                    try:
+                        allowed = frozenset(schema[u"enum"])
+                    except TypeError:
+                        allowed = None
+
+                if u"allOf" in self.VALIDATORS:
+                    for subschema in schema.get(u"allOf", ()):
+                        allowed = _utils.intersect(
+                            allowed,
+                            self._discriminator_values(subschema, path, seen),
+                        )
+
+                for keyword in (u"anyOf", u"oneOf"):
+                    if keyword not in self.VALIDATORS:
+                        continue
+                    branches = [
+                        self._discriminator_values(subschema, path, seen)
+                        for subschema in schema.get(keyword, ())
+                    ]
+                    if branches and None not in branches:
+                        allowed = _utils.intersect(
+                            allowed, frozenset().union(*branches),
+                        )
+                return allowed
+            finally:
+                if scope:
+                    self.resolver.pop_scope()
+
     if version is not None:
         Validator = validates(version)(Validator)
         Validator.__name__ = version.title().replace(" ", "") + "Validator"
+        # Lets pickle find the class by name, ex: for the cli's worker pool
+        Validator.__qualname__ = Validator.__name__
 
     return Validator
 
@@ -264,7 +395,9 @@ class RefResolver(object):
         remote_cache (functools.lru_cache):
 
             A cache that will be used for caching the results of
-            resolved remote URLs.
+            resolved remote URLs. Local ``#/...`` references are cached
+            here too, by their full URL, and the cache is cleared when
+            :attr:`store` changes.
 
     """
 
@@ -297,6 +430,7 @@ class RefResolver(object):
 
         self._urljoin_cache = urljoin_cache
         self._remote_cache = remote_cache
+        self._store_changes = self.store.changes
 
     @classmethod
     def from_schema(cls, schema, *args, **kwargs):
@@ -372,8 +506,37 @@ class RefResolver(object):
 
     def resolve(self, ref):
         url = self._urljoin_cache(self.resolution_scope, ref)
+        if getattr(self.store, "changes", None) != self._store_changes:
+            self.clear_cache()
         return url, self._remote_cache(url)
 
+    def cache_info(self):
+        """
+        Hit and miss counts of the resolved reference cache.
+
+        Returns:
+
+            the ``cache_info()`` of the ``remote_cache``, or ``None`` if it
+            does not report one
+
+        """
+
+        cache_info = getattr(self._remote_cache, "cache_info", None)
+        if cache_info is None:
+            return None
+        return cache_info()
+
+    def clear_cache(self):
+        """
+        Forget every resolved reference, ex: after the store changed.
+
+        """
+
+        cache_clear = getattr(self._remote_cache, "cache_clear", None)
+        if cache_clear is not None:
+            cache_clear()
+        self._store_changes = getattr(self.store, "changes", None)
+
     def resolve_from_url(self, url):
         url, fragment = urldefrag(url)
         try:
@@ -474,7 +637,12 @@ class RefResolver(object):
             result = json.loads(urlopen(uri).read().decode("utf-8"))
 
         if self.cache_remote:
+            # Only outside changes to the store invalidate the resolved
+            # references, not the documents it is filled with here
+            changes = getattr(self.store, "changes", None)
             self.store[uri] = result
+            if changes == self._store_changes:
+                self._store_changes = getattr(self.store, "changes", None)
         return result
 
 
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in
+# compliance with the License. A copy of the License is located at
+#
+#    http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import boto3
+import json
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from botocore.exceptions import ClientError
+
+# This Lambda is packaged on its own, so the token format and the LWA refresh request below are copies of
+# the ones in api/endpoint_cloud/api_handler_event.py (refresh_user_token) and must be kept in sync with them
+EXPIRATION_FORMAT = "%Y-%m-%dT%H:%M:%S.00Z"
+
+# Refresh tokens expiring within this many seconds
+LEAD_SECONDS = int(os.environ.get('lead_seconds', '600'))
+
+# The number of refreshes running at once
+MAX_WORKERS = int(os.environ.get('max_workers', '8'))
+
+# Stop starting new refreshes when less than this many milliseconds of the invocation are left
+RESERVED_MILLIS = 10000
+
+TABLE_NAME = os.environ.get('table_name', 'SampleUsers')
+
+# boto3 resources are not thread safe, so each worker thread gets its own table from its own session
+thread_local = threading.local()
+
+
+def get_table():
+    table = getattr(thread_local, 'table', None)
+    if table is None:
+        table = thread_local.table = boto3.session.Session().resource('dynamodb').Table(TABLE_NAME)
+    return table
+
+
+def handler(event, context):
+    """
+    Refresh the access tokens in SampleUsers that expire within the lead window
+    Meant to run on a schedule so events rarely have to refresh a token themselves
+    :param event: An optional 'lead_seconds' overrides the lead window
+    :return: The number of users scanned, refreshed, skipped and failed
+    """
+    print("LOG refresh.index.handler.event -----\n", json.dumps(event))
+
+    lead_seconds = int((event or {}).get('lead_seconds', LEAD_SECONDS))
+    refresh_before = (datetime.utcnow() + timedelta(seconds=lead_seconds)).strftime(EXPIRATION_FORMAT)
+    print("LOG refresh.index.handler.refresh_before:", refresh_before)
+
+    results = {'scanned': 0, 'refreshed': 0, 'skipped': 0, 'failed': 0}
+
+    def count(futures):
+        for future in futures:
+            if future.exception() is not None:
+                print('ERR refresh.index.handler: Refresh failed', future.exception())
+                results['failed'] += 1
+            else:
+                results[future.result()] += 1
+
+    running = set()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for item in (item for items in scan_expiring(refresh_before) for item in items):
+            # Only start a refresh once a worker is free, so the time left is checked before each one
+            if len(running) >= MAX_WORKERS:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                count(done)
+            if context is not None and context.get_remaining_time_in_millis() < RESERVED_MILLIS:
+                print('WARN refresh.index.handler: Out of time, stopping before the scan is complete')
+                break
+            results['scanned'] += 1
+            running.add(executor.submit(refresh_user, item))
+        count(wait(running)[0])
+
+    print("LOG refresh.index.handler.results:", results)
+    return results
+
+
+def scan_expiring(refresh_before):
+    """
+    Scan for the users with a refresh token and an access token expiring before the given time
+    :return: Each page of matching items
+    """
+    scan_kwargs = {
+        'FilterExpression': "attribute_exists(RefreshToken) AND (attribute_not_exists(ExpirationUTC) OR ExpirationUTC < :b)",
+        'ProjectionExpression': "UserId, ClientId, ClientSecret, ExpirationUTC, RedirectUri, RefreshToken",
+        'ExpressionAttributeValues': {':b': refresh_before}
+    }
+    while True:
+        result = get_table().scan(**scan_kwargs)
+        if result['Items']:
+            yield result['Items']
+        if 'LastEvaluatedKey' not in result:
+            return
+        scan_kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def refresh_user(item):
+    """
+    Refresh the access token of one user
+    The write is conditional on the stored token expiring before the new one, so a refresh done
+    meanwhile by an event is never overwritten
+    Keep the request and the stored values in sync with ApiHandlerEvent.refresh_user_token
+    :return: 'refreshed', 'skipped' when a fresher token was already stored, or 'failed'
+    """
+    user_id = item['UserId']
+    payload = {
+        'grant_type': 'refresh_token',
+        'refresh_token': item['RefreshToken'],
+        'client_id': item['ClientId'],
+        'client_secret': item['ClientSecret'],
+        'redirect_uri': item['RedirectUri']
+    }
+    headers = {
+        'content-type': "application/x-www-form-urlencoded",
+        'cache-control': "no-cache"
+    }
+    request = Request('https://api.amazon.com/auth/o2/token', data=urlencode(payload).encode('utf-8'), headers=headers)
+    try:
+        response = json.loads(urlopen(request, timeout=10).read().decode('utf-8'))
+        # Calculate expiration, an LWA error response has no expires_in
+        expiration_utc = datetime.utcnow() + timedelta(seconds=(int(response['expires_in']) - 5))
+    except (OSError, KeyError, ValueError) as e:
+        print('ERR refresh.index.refresh_user: Could not refresh the token of', user_id, e)
+        return 'failed'
+    expiration_utc = expiration_utc.strftime(EXPIRATION_FORMAT)
+
+    try:
+        get_table().update_item(
+            Key={
+                'UserId': user_id
+            },
+            UpdateExpression="set AccessToken=:a, RefreshToken=:r, TokenType=:t, ExpirationUTC=:e",
+            ConditionExpression="attribute_not_exists(ExpirationUTC) OR ExpirationUTC < :e",
+            ExpressionAttributeValues={
+                ':a': response['access_token'],
+                ':r': response['refresh_token'],
+                ':t': response['token_type'],
+                ':e': expiration_utc
+            }
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            print('LOG refresh.index.refresh_user: A fresher token is stored for', user_id)
+            return 'skipped'
+        print('ERR refresh.index.refresh_user: Could not store the token of', user_id, e)
+        return 'failed'
+
+    print('LOG refresh.index.refresh_user: Refreshed', user_id, 'until', expiration_utc)
+    return 'refreshed'